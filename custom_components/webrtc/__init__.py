@@ -1,29 +1,59 @@
 import asyncio
+import base64
+import hashlib
 import logging
 import time
 import uuid
 from pathlib import Path
 from urllib.parse import urlencode, urljoin
 
+import aiohttp
 import voluptuous as vol
-from aiohttp import web
-from aiohttp.web_exceptions import HTTPUnauthorized, HTTPGone, HTTPNotFound
+from aiohttp import hdrs, web
+from aiohttp.web_exceptions import (
+    HTTPBadRequest,
+    HTTPGone,
+    HTTPNotFound,
+    HTTPTooManyRequests,
+    HTTPUnauthorized,
+)
 from homeassistant.components.binary_sensor import HomeAssistant  # fix tests
 from homeassistant.components.camera import async_get_stream_source, async_get_image
-from homeassistant.components.http import HomeAssistantView
+from homeassistant.components.http import KEY_HASS_USER, HomeAssistantView
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import ATTR_ENTITY_ID, CONF_URL, EVENT_HOMEASSISTANT_STOP
-from homeassistant.core import ServiceCall
+from homeassistant.const import (
+    ATTR_ENTITY_ID,
+    CONF_URL,
+    EVENT_CORE_CONFIG_UPDATE,
+    EVENT_HOMEASSISTANT_STOP,
+    EVENT_STATE_CHANGED,
+)
+from homeassistant.core import Event, ServiceCall, callback
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.entity_registry import EVENT_ENTITY_REGISTRY_UPDATED
 from homeassistant.helpers.network import get_url
+from homeassistant.helpers.start import async_at_started
 from homeassistant.helpers.template import Template
 
-from . import utils
-from .utils import DOMAIN, Server
+from . import audio, buffer, fanout, prewarm, utils
+from .admission import ADMISSION, REJECT_MESSAGES
+from .links import LinkStore
+from .stats import STATS, Session
+from .utils import DOMAIN, SERVERS, Server, hide_credentials
+
+try:
+    from homeassistant.core import SupportsResponse
+
+    SERVICE_RESPONSE = {"supports_response": SupportsResponse.OPTIONAL}
+except ImportError:  # Hass before 2023.7
+    SERVICE_RESPONSE = {}
 
 _LOGGER = logging.getLogger(__name__)
 
+PLATFORMS = ["sensor"]
+
 CREATE_LINK_SCHEMA = vol.Schema(
     {
         vol.Required("link_id"): cv.string,
@@ -43,57 +73,201 @@ DASH_CAST_SCHEMA = vol.Schema(
         vol.Optional("extra"): dict,
         vol.Optional("force", default=False): bool,
         vol.Optional("hass_url"): str,
+        vol.Optional("timeout", default=10): cv.positive_int,
     },
     required=True,
 )
 
-LINKS = {}  # 2 3 4
+PREWARM_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Exclusive("url", "url"): cv.string,
+            vol.Exclusive("entity", "url"): cv.entity_ids,
+            vol.Optional("timeout"): cv.positive_int,
+        },
+        required=True,
+    ),
+    cv.has_at_least_one_key("url", "entity"),
+)
+
+SAVE_CLIP_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Exclusive("url", "url"): cv.string,
+            vol.Exclusive("entity", "url"): cv.entity_id,
+            vol.Required("filename"): cv.string,
+            vol.Optional("before", default=10): cv.positive_int,
+            vol.Optional("after", default=10): cv.positive_int,
+        },
+        required=True,
+    ),
+    cv.has_at_least_one_key("url", "entity"),
+)
+
+CONFIG_SCHEMA = vol.Schema(
+    {
+        vol.Optional(DOMAIN): vol.Schema(
+            {
+                # seconds
+                vol.Optional("poster_max_age", default=10): cv.positive_int,
+                # megabytes, 0 - disable cache
+                vol.Optional("poster_cache_size", default=8): cv.positive_int,
+                vol.Optional("poster_stale", default=False): cv.boolean,
+                # seconds, 0 - disable cache
+                vol.Optional("source_cache_ttl", default=300): cv.positive_int,
+                vol.Optional("links_max", default=1000): cv.positive_int,
+                vol.Optional("links_persist", default=False): cv.boolean,
+                # kilobytes, 0 - unlimited
+                vol.Optional("ws_queue_size", default=2048): cv.positive_int,
+                vol.Optional("ws_queue_policy", default="drop"): vol.In(
+                    ["drop", "disconnect"]
+                ),
+                # concurrent sessions limits, 0 - unlimited
+                vol.Optional("max_sessions", default=0): cv.positive_int,
+                vol.Optional("max_sessions_per_source", default=0): cv.positive_int,
+                vol.Optional("max_sessions_per_client", default=0): cv.positive_int,
+                # seconds in queue for a free session slot, 0 - reject at once
+                vol.Optional("sessions_queue_timeout", default=10): cv.positive_int,
+                # new connections per second from one client, 0 - unlimited
+                vol.Optional("rate_limit", default=0): vol.Coerce(float),
+                vol.Optional("rate_burst", default=10): cv.positive_int,
+                # one go2rtc connection for all MSE and MJPEG viewers of a stream
+                vol.Optional("fanout", default=False): cv.boolean,
+                # MB, MSE fragments from the last keyframe for new viewers, 0 - disable
+                vol.Optional("gop_cache_size", default=0): cv.positive_int,
+                vol.Optional("gop_cache_stream_size", default=4): cv.positive_int,
+                # additional go2rtc servers with the same streams
+                vol.Optional("servers", default=[]): vol.All(cv.ensure_list, [cv.url]),
+                vol.Optional("routing", default="least_loaded"): vol.In(
+                    ["least_loaded", "hash"]
+                ),
+                # hosts or URLs for go2rtc discovery in integration setup
+                vol.Optional("discovery", default=[]): vol.All(
+                    cv.ensure_list, [cv.string]
+                ),
+                # camera entities or stream URLs, always connected
+                vol.Optional("prewarm", default=[]): vol.All(cv.ensure_list, [cv.string]),
+                # seconds without viewers for webrtc.prewarm service streams
+                vol.Optional("prewarm_timeout", default=300): cv.positive_int,
+                # camera entities or stream URLs, last seconds are kept for clips
+                vol.Optional("buffer", default=[]): vol.All(cv.ensure_list, [cv.string]),
+                vol.Optional("buffer_seconds", default=30): cv.positive_int,
+                # megabytes for each stream
+                vol.Optional("buffer_size", default=16): cv.positive_int,
+            }
+        )
+    },
+    extra=vol.ALLOW_EXTRA,
+)
+
+SETTINGS: dict = CONFIG_SCHEMA({DOMAIN: {}})[DOMAIN]
+
+LINKS = LinkStore()
 
 # DDoS protection against requests to HLS proxy
 # streams are additionally protected by a random playlist identifier
 HLS_COOKIE = "webrtc-hls-session"
 HLS_SESSION = str(uuid.uuid4())
+HLS_CHUNK_SIZE = 64 * 1024
+
+# HLS session exists only on go2rtc server, where it was created
+HLS_SERVERS = utils.Cache(1000, lambda _: 1)
+
+# stream sources of camera entities
+SOURCES = utils.Cache(1000, lambda _: 1)
+SOURCE_FETCHES = utils.SingleFlight()
+TEMPLATES = utils.Cache(1000, lambda _: 1)
+
+# snapshots cache for card posters
+POSTER_STALE_TTL = 3600
+POSTERS = utils.Cache(0, lambda item: len(item[2]))
+POSTER_FETCHES = utils.SingleFlight()
+POSTER_MAX_WIDTH = 3840
+POSTER_MAX_HEIGHT = 2160
+# posters in one batch request and parallel loads for it
+POSTER_BATCH_MAX = 64
+POSTER_BATCH_CONCURRENCY = 4
+
+MJPEG_BOUNDARY = "frame"
+MJPEG_MAX_FPS = 30
+
+# card bundle: hash and bodies by encoding
+BUNDLE: dict[str, str | bytes] = {}
 
 
 async def async_setup(hass: HomeAssistant, config: dict):
-    # 1. Serve lovelace card
+    SETTINGS.update(config.get(DOMAIN) or {})
+
+    # 1. Serve lovelace card, separate modules for old resources and embed page
     path = Path(__file__).parent / "www"
     for name in ("video-rtc.js", "webrtc-camera.js", "digital-ptz.js"):
         await utils.register_static_path(hass, "/webrtc/" + name, str(path / name))
 
-    # 2. Add card to resources
-    version = getattr(hass.data["integrations"][DOMAIN], "version", 0)
-    await utils.init_resource(hass, "/webrtc/webrtc-camera.js", str(version))
+    cache = hass.config.path(".storage", f"{DOMAIN}_bundle")
+    ver, bodies = await hass.async_add_executor_job(
+        utils.build_bundle, str(path), cache
+    )
+    BUNDLE.update(bodies, ver=ver)
+    hass.http.register_view(BundleView)
+
+    # 2. Add card bundle to resources
+    await utils.init_resource(
+        hass, "/webrtc/webrtc-camera.", f"/webrtc/webrtc-camera.{ver}.js"
+    )
 
     # 3. Serve html page
     await utils.register_static_path(hass, "/webrtc/embed", str(path / "embed.html"))
 
     # 4. Serve WebSocket API
+    hass.bus.async_listen(
+        EVENT_STATE_CHANGED, invalidate_sources, event_filter=is_cached_source
+    )
+    for event_type in (EVENT_ENTITY_REGISTRY_UPDATED, EVENT_CORE_CONFIG_UPDATE):
+        hass.bus.async_listen(event_type, invalidate_sources)
+    POSTERS.maxsize = SETTINGS["poster_cache_size"] * 1024 * 1024
+    ADMISSION.max_total = SETTINGS["max_sessions"]
+    ADMISSION.max_source = SETTINGS["max_sessions_per_source"]
+    ADMISSION.max_client = SETTINGS["max_sessions_per_client"]
+    ADMISSION.timeout = SETTINGS["sessions_queue_timeout"]
+    ADMISSION.rate = SETTINGS["rate_limit"]
+    ADMISSION.burst = SETTINGS["rate_burst"]
+    fanout.GOP.maxsize = SETTINGS["gop_cache_size"] * 1024 * 1024
+    fanout.GOP.stream_maxsize = SETTINGS["gop_cache_stream_size"] * 1024 * 1024
     hass.http.register_view(WebSocketView)
 
     # 5. Serve HLS proxy
     hass.http.register_view(HLSView)
 
-    # 6. Register webrtc.create_link and webrtc.dash_cast services:
+    # 6. Serve proxy statistics, posters batch and players audio streams
+    hass.http.register_view(StatsView)
+    hass.http.register_view(PostersView)
+    hass.http.register_view(AudioView)
+
+    # 7. Register webrtc.create_link, webrtc.dash_cast, webrtc.prewarm and
+    # webrtc.save_clip services:
+
+    LINKS.maxsize = SETTINGS["links_max"]
+    await LINKS.async_setup(hass, SETTINGS["links_persist"])
 
     async def create_link(call: ServiceCall):
-        link_id = call.data["link_id"]
-        ttl = call.data["time_to_live"]
-        LINKS[link_id] = {
-            "url": call.data.get("url"),
-            "entity": call.data.get("entity"),
-            "limit": call.data["open_limit"],
-            "ts": time.time() + ttl if ttl else 0,
-        }
+        LINKS.add(
+            call.data["link_id"],
+            call.data.get("url"),
+            call.data.get("entity"),
+            call.data["open_limit"],
+            call.data["time_to_live"],
+        )
 
     async def dash_cast(call: ServiceCall):
+        entities = call.data[ATTR_ENTITY_ID]
         link_id = uuid.uuid4().hex
-        LINKS[link_id] = {
-            "url": call.data.get("url"),  # camera URL (rtsp...)
-            "entity": call.data.get("entity"),  # camera entity id
-            "limit": 1,  # 1 attempt
-            "ts": time.time() + 30,  # for 30 seconds
-        }
+        LINKS.add(
+            link_id,
+            call.data.get("url"),  # camera URL (rtsp...)
+            call.data.get("entity"),  # camera entity id
+            len(entities),  # 1 attempt for each device
+            30,  # for 30 seconds
+        )
 
         hass_url = call.data.get("hass_url") or get_url(hass)
         query = call.data.get("extra", {})
@@ -102,16 +276,40 @@ async def async_setup(hass: HomeAssistant, config: dict):
 
         _LOGGER.debug(f"dash_cast: {cast_url}")
 
-        await hass.async_add_executor_job(
-            utils.dash_cast,
-            hass,
-            call.data[ATTR_ENTITY_ID],
-            cast_url,
-            call.data.get("force", False),
+        results = await utils.dash_cast(
+            hass, entities, cast_url, call.data["force"], call.data["timeout"]
+        )
+        return {"devices": results}
+
+    async def prewarm_streams(call: ServiceCall):
+        timeout = call.data.get("timeout", SETTINGS["prewarm_timeout"])
+        if url := call.data.get("url"):
+            await prewarm_stream(hass, {"url": url}, timeout)
+        for entity_id in call.data.get("entity", []):
+            await prewarm_stream(hass, {"entity": entity_id}, timeout)
+
+    async def save_clip(call: ServiceCall):
+        filename = call.data["filename"]
+        if not hass.config.is_allowed_path(filename):
+            raise HomeAssistantError(f"Can't write {filename}, no access to path!")
+
+        key = "entity" if "entity" in call.data else "url"
+        query = await stream_query(hass, {key: call.data[key]})
+        if (buf := buffer.BUFFERS.get(query["src"])) is None:
+            raise HomeAssistantError(f"Stream isn't buffered: {call.data[key]}")
+
+        return await buffer.save_clip(
+            hass, buf, filename, call.data["before"], call.data["after"]
         )
 
     hass.services.async_register(DOMAIN, "create_link", create_link, CREATE_LINK_SCHEMA)
-    hass.services.async_register(DOMAIN, "dash_cast", dash_cast, DASH_CAST_SCHEMA)
+    hass.services.async_register(
+        DOMAIN, "dash_cast", dash_cast, DASH_CAST_SCHEMA, **SERVICE_RESPONSE
+    )
+    hass.services.async_register(DOMAIN, "prewarm", prewarm_streams, PREWARM_SCHEMA)
+    hass.services.async_register(
+        DOMAIN, "save_clip", save_clip, SAVE_CLIP_SCHEMA, **SERVICE_RESPONSE
+    )
 
     return True
 
@@ -127,41 +325,104 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     if go_url:
         # netloc example: admin:admin@192.168.1.123:1984
         hass.data[DOMAIN] = go_url
-        return True
+    else:
+        # 3. Serve go2rtc binary manually
+        binary = await utils.validate_binary(hass)
+        if not binary:
+            return False
 
-    # 3. Serve go2rtc binary manually
-    binary = await hass.async_add_executor_job(utils.validate_binary, hass)
-    if not binary:
-        return False
+        hass.data[DOMAIN] = server = Server(hass, binary)
+        server.start()
 
-    hass.data[DOMAIN] = server = Server(binary)
-    server.start()
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, server.stop)
 
-    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, server.stop)
+    # 4. Route streams between main and additional servers
+    SERVERS.setup(hass, hass.data[DOMAIN], SETTINGS["servers"], SETTINGS["routing"])
+
+    # 5. Keep streams from settings always connected and buffered
+    async def prewarm_settings(hass: HomeAssistant):
+        for stream in SETTINGS["prewarm"]:
+            key = "entity" if stream.startswith("camera.") else "url"
+            try:
+                await prewarm_stream(hass, {key: stream}, None)
+            except Exception as e:
+                _LOGGER.warning(f"Can't prewarm {stream}: {repr(e)}")
+
+        for stream in SETTINGS["buffer"]:
+            key = "entity" if stream.startswith("camera.") else "url"
+            try:
+                await buffer_stream(hass, {key: stream})
+            except Exception as e:
+                _LOGGER.warning(f"Can't buffer {stream}: {repr(e)}")
+
+    async_at_started(hass, prewarm_settings)
+
+    # 6. Proxy statistics sensors
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
     return True
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
+    await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+
+    SERVERS.stop()
+    prewarm.stop()
+    buffer.stop()
+
     server = hass.data[DOMAIN]
     if isinstance(server, Server):
-        server.stop()
+        await server.stop()
     return True
 
 
-async def ws_connect(hass: HomeAssistant, params: dict) -> str:
-    # 1. Server URL from card param
-    server: str = params.get("server")
-    # 2. Server URL from integration settings
-    if not server:
-        server: str | Server = hass.data[DOMAIN]
-    # 3. Server is manual binary
-    if isinstance(server, Server):
-        assert server.available, "WebRTC server not available"
-        server = "http://localhost:1984/"
+async def get_stream_source(hass: HomeAssistant, entity_id: str) -> str | None:
+    # some cameras get source from the cloud or ONVIF, so cache it
+    src = SOURCES.get(entity_id)
+    if src is None:
+        src = await SOURCE_FETCHES.run(
+            entity_id, lambda: async_get_stream_source(hass, entity_id)
+        )
+        SOURCES.set(entity_id, src or "", SETTINGS["source_cache_ttl"])
+    return src or None
+
+
+@callback
+def is_cached_source(event: Event | dict) -> bool:
+    """Skip state changes of all other entities without scheduling listener."""
+    # Hass 2024.4+ passes event data to the filter instead of event
+    data = event.data if isinstance(event, Event) else event
+    return data["entity_id"] in SOURCES.items
+
+
+@callback
+def invalidate_sources(event: Event):
+    if event.event_type == EVENT_STATE_CHANGED:
+        # skip attributes changes, because camera access_token changes every 5 min
+        old_state, new_state = event.data["old_state"], event.data["new_state"]
+        if old_state and new_state and old_state.state == new_state.state:
+            return
+        SOURCES.pop(event.data["entity_id"])
+    elif event.event_type == EVENT_ENTITY_REGISTRY_UPDATED:
+        SOURCES.pop(event.data["entity_id"])
+        if old_entity_id := event.data.get("old_entity_id"):
+            SOURCES.pop(old_entity_id)
+    else:
+        SOURCES.clear()
+
+
+def render_template(hass: HomeAssistant, source: str) -> str:
+    # reuse Template object, so it will be compiled only once
+    template = TEMPLATES.get(source)
+    if template is None:
+        template = Template(source, hass)
+        TEMPLATES.set(source, template, 3600)
+    return template.async_render()
+
 
+async def stream_query(hass: HomeAssistant, params: dict) -> dict:
     if entity_id := params.get("entity"):
-        src = await async_get_stream_source(hass, entity_id)
+        src = await get_stream_source(hass, entity_id)
         if src is None:
             # build link to MJPEG stream
             if state := hass.states.get(entity_id):
@@ -171,14 +432,46 @@ async def ws_connect(hass: HomeAssistant, params: dict) -> str:
         query = {"src": src, "name": entity_id}
     elif src := params.get("url"):
         if "{{" in src or "{%" in src:
-            src = Template(src, hass).async_render()
+            src = render_template(hass, src)
         query = {"src": src}
     else:
         raise Exception("Missing url or entity")
 
+    return query
+
+
+def ws_url(server: str, query: dict) -> str:
     return urljoin("ws" + server[4:], "api/ws") + "?" + urlencode(query)
 
 
+async def ws_connect(hass: HomeAssistant, params: dict) -> tuple[str, str]:
+    query = await stream_query(hass, params)
+    src = query["src"]
+    # server URL from card param, prewarmed stream or servers registry
+    server = params.get("server") or prewarm.get_server(src) or SERVERS.get(src)
+    return server, ws_url(server, query)
+
+
+async def prewarm_stream(hass: HomeAssistant, params: dict, timeout: int | None):
+    query = await stream_query(hass, params)
+    src = query["src"]
+    server = prewarm.get_server(src) or SERVERS.get(src)
+    prewarm.prewarm(hass, src, server, ws_url(server, query), timeout)
+
+
+async def buffer_stream(hass: HomeAssistant, params: dict):
+    query = await stream_query(hass, params)
+    src = query["src"]
+    server = prewarm.get_server(src) or SERVERS.get(src)
+    buffer.buffer(
+        hass,
+        src,
+        ws_url(server, query),
+        SETTINGS["buffer_size"] * 1024 * 1024,
+        SETTINGS["buffer_seconds"],
+    )
+
+
 def _get_image_from_entity_id(hass: HomeAssistant, entity_id: str):
     """Get camera component from entity_id."""
     if (component := hass.data.get("image")) is None:
@@ -190,33 +483,172 @@ def _get_image_from_entity_id(hass: HomeAssistant, entity_id: str):
     return image
 
 
-async def ws_poster(hass: HomeAssistant, params: dict) -> web.Response:
-    poster: str = params["poster"]
+def poster_size(params: dict) -> tuple[int, int, int]:
+    """Return width, height and JPEG quality from poster request, 0 - original."""
+    try:
+        width, height, quality = [
+            max(int(params.get(k) or 0), 0) for k in ("width", "height", "quality")
+        ]
+    except ValueError:
+        raise HTTPBadRequest()
+    width, height = min(width, POSTER_MAX_WIDTH), min(height, POSTER_MAX_HEIGHT)
+    return width, height, min(quality, 100)
 
-    if "{{" in poster or "{%" in poster:
-        # support Jinja2 tempaltes inside poster
-        poster = Template(poster, hass).async_render()
 
+def poster_key(poster: str, size: tuple) -> str:
+    return f"{poster}?{size[0]}x{size[1]}q{size[2]}" if any(size) else poster
+
+
+async def get_poster(
+    hass: HomeAssistant, poster: str, width: int = 0, height: int = 0
+) -> tuple[bytes, str]:
     if poster.startswith("camera."):
-        # support entity_id as poster
-        image = await async_get_image(hass, poster)
-        return web.Response(body=image.content, content_type=image.content_type)
+        # support entity_id as poster, Hass can scale camera image itself
+        image = await async_get_image(
+            hass, poster, width=width or None, height=height or None
+        )
+        return image.content, image.content_type
 
     if poster.startswith("image."):
         # support entity_id as poster
         image_entity = _get_image_from_entity_id(hass, poster)
         image = await image_entity.async_image()
         _LOGGER.debug(f"webrtc image_entity: {image_entity} - {len(image)}")
-        return web.Response(body=image, content_type="image/jpeg")
+        return image, "image/jpeg"
 
-    # support poster from go2rtc stream name
-    entry = hass.data[DOMAIN]
-    url = "http://localhost:1984/" if isinstance(entry, Server) else entry
-    url = urljoin(url, "api/frame.jpeg") + "?" + urlencode({"src": poster})
+    # support poster from go2rtc stream name, go2rtc can scale frame itself
+    query = {"src": poster}
+    if width:
+        query["width"] = width
+    if height:
+        query["height"] = height
+    url = urljoin(SERVERS.get(poster), "api/frame.jpeg") + "?" + urlencode(query)
 
     async with async_get_clientsession(hass).get(url) as r:
         body = await r.read()
-        return web.Response(body=body, content_type=r.content_type)
+        return body, r.content_type
+
+
+async def update_poster(hass: HomeAssistant, poster: str, size: tuple) -> tuple:
+    body, content_type = await get_poster(hass, poster, size[0], size[1])
+    if any(size):
+        # image source may ignore size, so check it and re-encode if needed
+        resized = await hass.async_add_executor_job(utils.resize_image, body, *size)
+        if resized is not body:
+            body, content_type = resized, "image/jpeg"
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    item = (time.monotonic(), etag, body, content_type)
+    ttl = POSTER_STALE_TTL if SETTINGS["poster_stale"] else SETTINGS["poster_max_age"]
+    POSTERS.set(poster_key(poster, size), item, ttl)
+    return item
+
+
+async def refresh_poster(hass: HomeAssistant, poster: str, size: tuple):
+    key = poster_key(poster, size)
+    try:
+        await POSTER_FETCHES.run(key, lambda: update_poster(hass, poster, size))
+    except Exception as e:
+        _LOGGER.debug(f"Can't refresh poster {poster}: {repr(e)}")
+
+
+async def get_poster_item(hass: HomeAssistant, params: dict) -> tuple:
+    """Return cached poster (time, etag, body, content type) or load new one."""
+    poster: str = params["poster"]
+
+    if "{{" in poster or "{%" in poster:
+        # support Jinja2 tempaltes inside poster
+        poster = render_template(hass, poster)
+
+    max_age = SETTINGS["poster_max_age"]
+    size = poster_size(params)
+    key = poster_key(poster, size)
+
+    def update():
+        return update_poster(hass, poster, size)
+
+    # one snapshot for all cards with same poster and size
+    item = POSTERS.get(key)
+    if item is None:
+        item = await POSTER_FETCHES.run(key, update)
+    elif time.monotonic() - item[0] > max_age:
+        if SETTINGS["poster_stale"]:
+            # serve stale poster while new one is loading
+            hass.async_create_task(refresh_poster(hass, poster, size))
+        else:
+            item = await POSTER_FETCHES.run(key, update)
+
+    return item
+
+
+async def ws_poster(
+    hass: HomeAssistant, params: dict, request: web.Request = None
+) -> web.Response:
+    _, etag, body, content_type = await get_poster_item(hass, params)
+
+    max_age = SETTINGS["poster_max_age"]
+    headers = {hdrs.ETAG: etag, hdrs.CACHE_CONTROL: f"private, max-age={max_age}"}
+
+    if request and request.headers.get(hdrs.IF_NONE_MATCH) == etag:
+        return web.Response(status=304, headers=headers)
+
+    return web.Response(body=body, content_type=content_type, headers=headers)
+
+
+async def http_mjpeg(
+    hass: HomeAssistant, params: dict, request: web.Request
+) -> web.StreamResponse:
+    """MJPEG for plain <img> tag, so browser doesn't decode frames in JS.
+    Frames are dropped on the server down to requested FPS.
+    """
+    try:
+        fps = float(params.get("fps") or 0)
+    except ValueError:
+        raise HTTPBadRequest()
+    if not 0 <= fps <= MJPEG_MAX_FPS:
+        raise HTTPBadRequest()
+
+    # same limits as for WebSocket sessions, by the real peer address
+    src = hide_credentials(params.get("entity") or params.get("url"))
+    if reason := await ADMISSION.acquire(src, request.remote):
+        raise HTTPTooManyRequests(text=REJECT_MESSAGES[reason])
+
+    server = hub = None
+    frame = fanout.LatestFrame()
+    try:
+        server, url = await ws_connect(hass, params)
+        SERVERS.acquire(server)
+        hub = await fanout.subscribe(hass, url, fanout.MJPEG_REQUEST, frame)
+
+        response = web.StreamResponse(
+            headers={
+                hdrs.CONTENT_TYPE: f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}",
+                hdrs.CACHE_CONTROL: "no-cache",
+            }
+        )
+        await response.prepare(request)
+
+        interval = 1 / fps if fps else 0
+        while (data := await frame.get()) is not None:
+            ts = hass.loop.time()
+            await response.write(
+                b"--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n"
+                % (MJPEG_BOUNDARY.encode(), len(data))
+                + data
+                + b"\r\n"
+            )
+            if interval:
+                # frames received while waiting are replaced by the last one
+                await asyncio.sleep(ts + interval - hass.loop.time())
+    except ConnectionResetError:
+        pass
+    finally:
+        ADMISSION.release(src, request.remote)
+        if hub:
+            hub.unsubscribe(frame)
+        if server:
+            SERVERS.release(server)
+
+    return response
 
 
 class WebSocketView(HomeAssistantView):
@@ -228,21 +660,16 @@ class WebSocketView(HomeAssistantView):
         params = request.query
         _LOGGER.debug(f"New client: {dict(params)}")
 
+        session = Session()
+
         if request.query.get("embed"):
             link_id = request.query.get("url")
             if link_id not in LINKS:
                 raise HTTPNotFound()
 
-            link = LINKS[link_id]
-            if link["ts"] and time.time() > link["ts"]:
-                LINKS.pop(link_id)
+            if not (link := LINKS.use(link_id)):
                 raise HTTPGone()
 
-            if link["limit"]:
-                link["limit"] -= 1
-                if link["limit"] == 0:
-                    LINKS.pop(link_id)
-
             params = link
 
         # fix for https://github.com/AlexxIT/WebRTC/pull/320
@@ -250,20 +677,64 @@ class WebSocketView(HomeAssistantView):
             # you shall not pass
             raise HTTPUnauthorized()
 
+        session.mark("sign")
+
         hass = request.app["hass"]
 
         if "poster" in params:
-            return await ws_poster(hass, params)
+            return await ws_poster(hass, params, request)
+
+        if "mjpeg" in params:
+            return await http_mjpeg(hass, params, request)
 
         ws_server = web.WebSocketResponse(autoclose=False, autoping=False)
         ws_server.set_cookie(HLS_COOKIE, HLS_SESSION)
         await ws_server.prepare(request)
 
-        try:
-            url = await ws_connect(hass, params)
+        remote = request.headers.get("X-Forwarded-For")
+        remote = remote + ", " + request.remote if remote else request.remote
+
+        session.src = hide_credentials(params.get("entity") or params.get("url"))
+        session.remote = remote.split(",", 1)[0]
+
+        session.mark("prepare")
 
-            remote = request.headers.get("X-Forwarded-For")
-            remote = remote + ", " + request.remote if remote else request.remote
+        # X-Forwarded-For can be set by the client, so limits use the real peer
+        client = request.remote
+        if reason := await ADMISSION.acquire(session.src, client):
+            error = {"type": "error", "value": REJECT_MESSAGES[reason]}
+            await ws_server.send_json(error)
+            await ws_server.close(code=aiohttp.WSCloseCode.TRY_AGAIN_LATER)
+            return ws_server
+
+        session.mark("admission")
+
+        server = warm = None
+        try:
+            server, url = await ws_connect(hass, params)
+            SERVERS.acquire(server)
+            session.server = hide_credentials(server)
+            session.mark("connect")
+
+            if warm := prewarm.find(url):
+                warm.join()
+                session.warm = warm.connected
+
+            msg = None
+            # shared upstream can't answer WebRTC offer, so global setting and
+            # keyframe cache are used only for cards without WebRTC
+            mse_only = fanout.mse_only(params.get("mode"))
+            share = SETTINGS["fanout"] and mse_only or params.get("fanout")
+            gop = fanout.GOP.maxsize and mse_only
+            if share or gop:
+                # first viewer message decides if upstream can be shared
+                msg = await ws_server.receive()
+                types = fanout.FANOUT_TYPES if share else ("mse",)
+                if data := fanout.fanout_request(msg, types):
+                    await self.fanout(hass, session, ws_server, url, data)
+                    return ws_server
+                if msg.type is not aiohttp.WSMsgType.TEXT:
+                    return ws_server
 
             # https://www.nginx.com/resources/wiki/start/topics/examples/forwarded/
             async with async_get_clientsession(hass).ws_connect(
@@ -277,20 +748,169 @@ class WebSocketView(HomeAssistantView):
                     "X-Forwarded-Proto": request.scheme,
                 },
             ) as ws_client:
-                # Proxy requests
-                await asyncio.wait(
-                    [
-                        asyncio.create_task(utils.websocket_forward(ws_server, ws_client)),
-                        asyncio.create_task(utils.websocket_forward(ws_client, ws_server)),
-                    ],
-                    return_when=asyncio.FIRST_COMPLETED,
+                session.mark("handshake")
+                if msg:
+                    await ws_client.send_str(msg.data)
+
+                session.forward_in = utils.WebSocketForward(ws_server, ws_client)
+                session.forward_out = utils.WebSocketForward(
+                    ws_client,
+                    ws_server,
+                    SETTINGS["ws_queue_size"] * 1024,
+                    SETTINGS["ws_queue_policy"],
                 )
+                STATS.start(session)
 
+                # Proxy requests
+                try:
+                    await asyncio.wait(
+                        [
+                            asyncio.create_task(session.forward_in.run()),
+                            asyncio.create_task(session.forward_out.run()),
+                        ],
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                finally:
+                    STATS.stop(session)
+
+        except aiohttp.ClientConnectorError as e:
+            # remove dead server from routing until next health check
+            SERVERS.set_available(server, False)
+            await ws_server.send_json({"type": "error", "value": str(e)})
         except Exception as e:
             await ws_server.send_json({"type": "error", "value": str(e)})
+        finally:
+            ADMISSION.release(session.src, client)
+            if server:
+                SERVERS.release(server)
+            if warm:
+                warm.leave()
 
         return ws_server
 
+    @staticmethod
+    async def fanout(
+        hass: HomeAssistant,
+        session: Session,
+        ws_server: web.WebSocketResponse,
+        url: str,
+        data: str,
+    ):
+        session.forward_out = utils.WebSocketForward(
+            None, ws_server, SETTINGS["ws_queue_size"] * 1024, SETTINGS["ws_queue_policy"]
+        )
+        hub = await fanout.subscribe(hass, url, data, session.forward_out)
+        session.mark("handshake")
+        STATS.start(session)
+
+        tasks = [
+            asyncio.create_task(session.forward_out.run()),
+            asyncio.create_task(fanout.read_viewer(ws_server, session.forward_out)),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            hub.unsubscribe(session.forward_out)
+            STATS.stop(session)
+            for task in tasks:
+                task.cancel()
+
+
+class PostersView(HomeAssistantView):
+    url = "/api/webrtc/posters"
+    name = "api:webrtc:posters"
+    requires_auth = True
+
+    async def post(self, request: web.Request):
+        """Load many posters with one request, for grid dashboards.
+        Request: {"posters": [{"poster": "camera.x", "width": 300}, ...]}
+        """
+        try:
+            data = await request.json()
+            posters = [
+                {"poster": p} if isinstance(p, str) else dict(p)
+                for p in data["posters"]
+            ]
+            assert 0 < len(posters) <= POSTER_BATCH_MAX
+        except Exception:
+            raise HTTPBadRequest()
+
+        hass: HomeAssistant = request.app["hass"]
+        semaphore = asyncio.Semaphore(POSTER_BATCH_CONCURRENCY)
+
+        async def load(params: dict) -> dict:
+            async with semaphore:
+                try:
+                    _, etag, body, content_type = await get_poster_item(hass, params)
+                except Exception as e:
+                    return {"poster": params.get("poster"), "error": str(e)}
+            return {
+                "poster": params["poster"],
+                "etag": etag,
+                "content_type": content_type,
+                "data": base64.b64encode(body).decode(),
+            }
+
+        return self.json({"posters": await asyncio.gather(*map(load, posters))})
+
+
+class StatsView(HomeAssistantView):
+    url = "/api/webrtc/stats"
+    name = "api:webrtc:stats"
+    requires_auth = True
+
+    async def get(self, request: web.Request):
+        # client IPs and stream sources, that may contain camera credentials
+        if not request[KEY_HASS_USER].is_admin:
+            raise HTTPUnauthorized()
+        return self.json(STATS.as_dict())
+
+
+class BundleView(HomeAssistantView):
+    url = "/webrtc/webrtc-camera.{ver}.js"
+    name = "webrtc:bundle"
+    requires_auth = False
+
+    async def get(self, request: web.Request, ver: str):
+        if ver != BUNDLE["ver"]:
+            raise HTTPNotFound()
+
+        accept = request.headers.get("Accept-Encoding", "")
+        encoding = next(
+            (k for k in ("br", "gzip") if k in BUNDLE and k in accept), "identity"
+        )
+
+        # url changes with content, so it can be cached forever
+        headers = {
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "Vary": "Accept-Encoding",
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        return web.Response(
+            body=BUNDLE[encoding],
+            content_type="application/javascript",
+            headers=headers,
+        )
+
+
+class AudioView(HomeAssistantView):
+    url = "/api/webrtc/audio/{token}"
+    name = "api:webrtc:audio"
+    requires_auth = False
+
+    async def get(self, request: web.Request, token: str):
+        # go2rtc can't auth, so access only by the player secret token
+        if (stream := audio.STREAMS.get(token)) is None:
+            raise HTTPNotFound()
+
+        response = web.StreamResponse()
+        response.content_type = "audio/mpeg"
+        await response.prepare(request)
+        await stream.serve(response)
+        return response
+
 
 class HLSView(HomeAssistantView):
     url = "/api/webrtc/hls/{filename}"
@@ -305,13 +925,50 @@ class HLSView(HomeAssistantView):
             raise HTTPNotFound()
 
         hass: HomeAssistant = request.app["hass"]
-        entry = hass.data[DOMAIN]
-        url = "http://localhost:1984/" if isinstance(entry, Server) else entry
-        url = urljoin(url, "api/hls/" + filename) + "?" + request.query_string
+        hls_id = request.query.get("id")
+        path = "api/hls/" + filename + "?" + request.query_string
+
+        # playlist is small text and always fresh
+        if filename == "playlist.m3u8":
+            # new HLS session may be on any of the servers
+            server = HLS_SERVERS.get(hls_id)
+            for server in [server] if server else SERVERS.urls():
+                async with async_get_clientsession(hass).get(urljoin(server, path)) as r:
+                    if r.ok:
+                        body = await r.read()
+                        break
+            else:
+                raise HTTPNotFound()
 
+            HLS_SERVERS.set(hls_id, server, 3600)
+
+            return web.Response(body=body, content_type=r.content_type)
+
+        url = urljoin(HLS_SERVERS.get(hls_id) or SERVERS.get(), path)
+
+        return await self.proxy(request, url)
+
+    @staticmethod
+    async def proxy(request: web.Request, url: str):
+        hass: HomeAssistant = request.app["hass"]
         async with async_get_clientsession(hass).get(url) as r:
             if not r.ok:
                 raise HTTPNotFound()
 
-            body = await r.read()
-            return web.Response(body=body, content_type=r.content_type)
+            response = web.StreamResponse()
+            response.content_type = r.content_type
+            if r.content_length is not None:
+                response.content_length = r.content_length
+            if cache_control := r.headers.get(hdrs.CACHE_CONTROL):
+                response.headers[hdrs.CACHE_CONTROL] = cache_control
+            await response.prepare(request)
+
+            try:
+                # memory per request is limited by chunk size and aiohttp buffers
+                async for chunk in r.content.iter_chunked(HLS_CHUNK_SIZE):
+                    await response.write(chunk)
+                await response.write_eof()
+            except ConnectionResetError:
+                _LOGGER.debug("HLS client disconnected")
+
+        return response
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import time
+
+from .utils import Cache
+
+_LOGGER = logging.getLogger(__name__)
+
+REJECT_MESSAGES = {
+    "rate": "Too many new connections from the client, try again later",
+    "total": "Too many sessions, try again later",
+    "source": "Too many sessions for the stream, try again later",
+    "client": "Too many sessions from the client, try again later",
+}
+
+
+class Admission:
+    """Limits for concurrent sessions globally, per source and per client, and
+    token bucket for new connections of each client. Sessions over concurrent
+    limits wait in the queue for a free slot until timeout. 0 - no limit.
+    """
+
+    def __init__(self):
+        self.max_total = 0
+        self.max_source = 0
+        self.max_client = 0
+        self.rate = 0.0  # new connections per second for one client
+        self.burst = 0
+        self.timeout = 0  # seconds in the queue, 0 - reject at once
+
+        self.total = 0
+        self.sources: dict[str, int] = {}
+        self.clients: dict[str, int] = {}
+        # client => (tokens, update time)
+        self.buckets = Cache(10000, lambda _: 1)
+        # replaced on each release, so all waiters recheck limits
+        self.released = asyncio.Event()
+
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected: dict[str, int] = {}
+
+    def take_token(self, client: str) -> bool:
+        if not self.rate:
+            return True
+
+        now = time.monotonic()
+        tokens, ts = self.buckets.get(client) or (self.burst, now)
+        tokens = min(self.burst, tokens + (now - ts) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+
+        # full bucket is the same as no bucket
+        self.buckets.set(client, (tokens, now), (self.burst - tokens) / self.rate + 1)
+        return allowed
+
+    def over_limit(self, src: str, client: str) -> str | None:
+        if self.max_total and self.total >= self.max_total:
+            return "total"
+        if self.max_source and self.sources.get(src, 0) >= self.max_source:
+            return "source"
+        if self.max_client and self.clients.get(client, 0) >= self.max_client:
+            return "client"
+        return None
+
+    async def acquire(self, src: str, client: str) -> str | None:
+        """Return reason if session is rejected."""
+        reason = "rate" if not self.take_token(client) else None
+
+        if not reason and (reason := self.over_limit(src, client)) and self.timeout:
+            self.queued += 1
+            self.waiting += 1
+            deadline = time.monotonic() + self.timeout
+            try:
+                while reason and (timeout := deadline - time.monotonic()) > 0:
+                    try:
+                        await asyncio.wait_for(self.released.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    reason = self.over_limit(src, client)
+            finally:
+                self.waiting -= 1
+
+        if reason:
+            _LOGGER.debug(f"Reject session by {reason} limit: {src}, {client}")
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+            return reason
+
+        self.total += 1
+        self.sources[src] = self.sources.get(src, 0) + 1
+        self.clients[client] = self.clients.get(client, 0) + 1
+        self.admitted += 1
+        return None
+
+    def release(self, src: str, client: str):
+        self.total -= 1
+        for counts, key in ((self.sources, src), (self.clients, client)):
+            if counts[key] > 1:
+                counts[key] -= 1
+            else:
+                counts.pop(key)
+
+        self.released.set()
+        self.released = asyncio.Event()
+
+    def as_dict(self) -> dict:
+        return {
+            "active": self.total,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+        }
+
+
+ADMISSION = Admission()
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import secrets
+from typing import Awaitable, Callable, Iterator
+
+from aiohttp import web
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+
+_LOGGER = logging.getLogger(__name__)
+
+# kbps for MPEG1 and MPEG2/2.5 layer III
+BITRATES = {
+    3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+
+# seconds of audio sent ahead of real time, more - bigger delay on new item
+LEAD = 0.2
+# stop stream after seconds of silence, so go2rtc releases camera speaker
+IDLE_TIMEOUT = 60
+
+
+def frame_info(data: bytes, offset: int = 0) -> tuple[int, float] | None:
+    """Return length in bytes and duration in seconds of MP3 frame."""
+    b1, b2 = data[offset + 1], data[offset + 2]
+    if data[offset] != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 3  # 3 - MPEG1, 2 - MPEG2, 0 - MPEG2.5
+    layer = (b1 >> 1) & 3  # 1 - layer III
+    bitrate = b2 >> 4
+    rate = (b2 >> 2) & 3
+    if version == 1 or layer != 1 or bitrate in (0, 15) or rate == 3:
+        return None
+
+    kbps = BITRATES[3 if version == 3 else 2][bitrate]
+    sample_rate = SAMPLE_RATES[version][rate]
+    samples = 1152 if version == 3 else 576
+    length = samples // 8 * kbps * 1000 // sample_rate + ((b2 >> 1) & 1)
+    return length, samples / sample_rate
+
+
+def silent_frame(frame: bytes) -> bytes:
+    """Frame with the same format and zero side info, that decodes to silence."""
+    header = bytes([0xFF, frame[1] | 1, frame[2] & 0xFD, frame[3]])
+    return header + b"\0" * (frame_info(header + b"\0")[0] - 4)
+
+
+# MPEG1 layer III, 32 kbps, 44100 Hz, mono
+SILENCE = silent_frame(b"\xff\xfb\x10\xc0")
+
+MP3_TYPES = ("audio/mpeg", "audio/mp3")
+
+
+def is_mp3(data: bytes) -> bool:
+    """Check start of the file, MP3 starts with ID3 tag or with frame."""
+    return data[:3] == b"ID3" or (len(data) >= 3 and frame_info(data) is not None)
+
+
+class MP3Parser:
+    """Split MP3 stream to frames, skip ID3 tags and garbage."""
+
+    def __init__(self):
+        self.buf = b""
+
+    def feed(self, data: bytes) -> Iterator[tuple[bytes, float]]:
+        buf = self.buf + data
+        i = 0
+        while len(buf) - i >= 10:
+            if buf[i : i + 3] == b"ID3":
+                # syncsafe integer, 7 bits in each byte
+                size = 10 + sum(
+                    b << (7 * (3 - n)) for n, b in enumerate(buf[i + 6 : i + 10])
+                )
+                if len(buf) - i < size:
+                    break
+                i += size
+                continue
+
+            if (info := frame_info(buf, i)) is None:
+                i += 1
+                continue
+
+            length, duration = info
+            if len(buf) - i < length:
+                break
+            yield buf[i : i + length], duration
+            i += length
+
+        self.buf = buf[i:]
+
+
+class AudioStream:
+    """Endless MP3 stream for one player. go2rtc reads it with one long-lived
+    ffmpeg producer, queued items are written to it while they are downloaded,
+    and silence is written between them. Other formats are played by fallback.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        on_change: Callable,
+        fallback: Callable[[str], Awaitable],
+    ):
+        self.hass = hass
+        self.token = secrets.token_urlsafe(16)
+        self.on_change = on_change
+        self.fallback = fallback
+
+        self.queue: asyncio.Queue[str] = asyncio.Queue()
+        self.playing: str | None = None
+        self.skip = False
+        self.silence = SILENCE
+
+        # current reader (go2rtc) and real time clock for it
+        self.response: web.StreamResponse | None = None
+        self.waiter: asyncio.Future | None = None
+        self.start = 0.0
+        self.sent = 0.0
+
+        STREAMS[self.token] = self
+
+    @property
+    def path(self) -> str:
+        return "/api/webrtc/audio/" + self.token
+
+    @property
+    def connected(self) -> bool:
+        return self.response is not None
+
+    @property
+    def busy(self) -> bool:
+        return self.playing is not None or not self.queue.empty()
+
+    def connect_waiter(self) -> asyncio.Future:
+        """Future, that is done when the next reader connects."""
+        self.waiter = self.hass.loop.create_future()
+        return self.waiter
+
+    def play(self, url: str):
+        self.queue.put_nowait(url)
+        self.on_change()
+
+    def stop(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.skip = True
+        self.on_change()
+
+    def close(self):
+        STREAMS.pop(self.token, None)
+        self.stop()
+        self.response = None
+
+    async def serve(self, response: web.StreamResponse):
+        # new reader replaces the old one
+        self.response = response
+        if self.waiter and not self.waiter.done():
+            self.waiter.set_result(None)
+        self.start = self.hass.loop.time()
+        self.sent = 0.0
+
+        idle = 0.0
+        silence = frame_info(self.silence)[1]
+        while self.response is response and idle < IDLE_TIMEOUT:
+            try:
+                url = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                await self.write(response, self.silence, silence)
+                idle += silence
+                continue
+
+            await self.play_url(response, url)
+            silence = frame_info(self.silence)[1]
+            idle = 0.0
+
+        if self.response is response:
+            self.response = None
+
+    async def play_url(self, response: web.StreamResponse, url: str):
+        self.playing = url
+        self.skip = False
+        self.on_change()
+
+        parser = MP3Parser()
+        frame = None
+        try:
+            async with async_get_clientsession(self.hass).get(url) as r:
+                data = await r.content.read(10)
+                if r.content_type not in MP3_TYPES and not is_mp3(data):
+                    _LOGGER.warning(f"Can't stream {url}: not MP3, play it with ffmpeg")
+                    # fallback producer replaces this stream in go2rtc, so next
+                    # items would wait for the next play in the queue
+                    while not self.queue.empty():
+                        self.queue.get_nowait()
+                    self.response = None
+                    self.hass.async_create_task(self.fallback(url))
+                    return
+
+                while data:
+                    for frame, duration in parser.feed(data):
+                        if self.skip or self.response is not response:
+                            return
+                        await self.write(response, frame, duration)
+                    data = await r.content.readany()
+        except Exception as e:
+            if self.response is response:
+                _LOGGER.warning(f"Can't play {url}: {repr(e)}")
+        finally:
+            # silence in the same format, so decoder doesn't reinit
+            if frame:
+                self.silence = silent_frame(frame)
+            self.playing = None
+            self.on_change()
+
+    async def write(self, response: web.StreamResponse, frame: bytes, duration: float):
+        ahead = self.sent - (self.hass.loop.time() - self.start)
+        if ahead > LEAD:
+            await asyncio.sleep(ahead - LEAD)
+        elif ahead < 0:
+            # source was slow, don't send burst to catch up
+            self.start += ahead
+
+        try:
+            await response.write(frame)
+        except ConnectionResetError:
+            self.response = None
+            raise
+
+        self.sent += duration
+
+
+# token => AudioStream
+STREAMS: dict[str, AudioStream] = {}
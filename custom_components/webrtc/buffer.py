@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+from collections import deque
+
+from homeassistant.core import HomeAssistant
+
+from . import mp4
+from .fanout import Consumer
+from .prewarm import MSE_REQUEST
+from .utils import RESTART_DELAY, RESTART_DELAY_MAX
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """MSE fragments in preallocated memory. The oldest fragments are
+    overwritten by new ones, or removed when older than seconds limit.
+    """
+
+    def __init__(self, size: int, seconds: int):
+        self.buf = bytearray(size)
+        self.seconds = seconds
+        self.pos = 0
+        # (receive time, offset, length, keyframe), from old to new
+        self.items: deque[tuple[float, int, int, bool]] = deque()
+
+    def clear(self):
+        self.items.clear()
+        self.pos = 0
+
+    def append(self, ts: float, data: bytes, keyframe: bool):
+        size = len(data)
+        if size > len(self.buf):
+            self.clear()
+            return
+
+        if self.pos + size > len(self.buf):
+            # the rest of the previous lap is older than the start of this one
+            while self.items and self.items[0][1] >= self.pos:
+                self.items.popleft()
+            self.pos = 0
+
+        end = self.pos + size
+        while self.items and self.pos <= self.items[0][1] < end:
+            self.items.popleft()
+        while self.items and self.items[0][0] < ts - self.seconds:
+            self.items.popleft()
+
+        self.buf[self.pos : end] = data
+        self.items.append((ts, self.pos, size, keyframe))
+        self.pos = end
+
+    def snapshot(self, since: float) -> tuple[float | None, list[bytes]]:
+        """Copy fragments from the last keyframe before since time, or from the
+        first keyframe if buffer is shorter. Return time of the first fragment.
+        """
+        start = None
+        for i, (ts, _, _, keyframe) in enumerate(self.items):
+            if keyframe and (start is None or ts <= since):
+                start = i
+            if ts > since and start is not None:
+                break
+
+        if start is None:
+            return None, []
+
+        items = list(self.items)[start:]
+        return items[0][0], [bytes(self.buf[o : o + n]) for _, o, n, _ in items]
+
+
+class StreamBuffer(Consumer):
+    """Hidden MSE consumer of the stream, that keeps the last seconds of it."""
+
+    def __init__(self, hass: HomeAssistant, url: str, size: int, seconds: int):
+        super().__init__()
+        self.hass = hass
+        self.url = url
+        self.ring = RingBuffer(size, seconds)
+        self.init: bytes | None = None
+        self.video_tracks: set[int] = set()
+        # queues of clips, that are being saved
+        self.listeners: set[asyncio.Queue] = set()
+        self.task = hass.loop.create_task(self.run())
+
+    async def run(self):
+        delay = RESTART_DELAY
+        while True:
+            await self.consume(self.hass, self.url, MSE_REQUEST)
+
+            if self.ring.items:
+                delay = RESTART_DELAY
+            # fragments after reconnect will have new timeline
+            self.ring.clear()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RESTART_DELAY_MAX)
+
+    async def put_binary(self, data: bytes) -> bool:
+        self.on_binary(data)
+        return True
+
+    def on_binary(self, data: bytes):
+        if mp4.is_init(data):
+            self.init = data
+            self.video_tracks = mp4.video_tracks(data)
+            self.ring.clear()
+        elif mp4.is_fragment(data):
+            keyframe = mp4.is_keyframe(data, self.video_tracks)
+            self.ring.append(self.hass.loop.time(), data, keyframe)
+        else:
+            return
+
+        for queue in self.listeners:
+            queue.put_nowait(data)
+
+
+# stream source => StreamBuffer
+BUFFERS: dict[str, StreamBuffer] = {}
+
+
+def buffer(hass: HomeAssistant, src: str, url: str, size: int, seconds: int):
+    if src not in BUFFERS:
+        _LOGGER.debug(f"Buffer stream for {seconds} seconds: {url}")
+        BUFFERS[src] = StreamBuffer(hass, url, size, seconds)
+
+
+def open_clip(path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return open(path, "wb")
+
+
+async def save_clip(
+    hass: HomeAssistant, buf: StreamBuffer, path: str, before: int, after: int
+) -> dict:
+    """Write fragments before and after the event to fMP4 file without
+    transcoding. File is written in the executor, by batches of fragments.
+    """
+    if buf.init is None:
+        raise Exception("Stream buffer is empty")
+
+    now = hass.loop.time()
+    start, chunks = buf.ring.snapshot(now - before)
+    chunks.insert(0, buf.init)
+
+    # fragments after snapshot, without gap because there is no await between
+    queue = asyncio.Queue()
+    buf.listeners.add(queue)
+
+    f = await hass.async_add_executor_job(open_clip, path)
+    size = 0
+    done = False
+    try:
+        while True:
+            await hass.async_add_executor_job(f.writelines, chunks)
+            size += sum(len(chunk) for chunk in chunks)
+
+            timeout = now + after - hass.loop.time()
+            if done or timeout <= 0:
+                break
+            try:
+                chunks = [await asyncio.wait_for(queue.get(), timeout)]
+            except asyncio.TimeoutError:
+                break
+            while not queue.empty():
+                chunks.append(queue.get_nowait())
+
+            for i, chunk in enumerate(chunks):
+                # new init segment, next fragments can't be joined with previous
+                if mp4.is_init(chunk):
+                    chunks = chunks[:i]
+                    done = True
+                    break
+    finally:
+        buf.listeners.discard(queue)
+        await hass.async_add_executor_job(f.close)
+
+    return {
+        "path": path,
+        "size": size,
+        "before": round(now - start, 1) if start is not None else 0,
+        "after": round(hass.loop.time() - now, 1),
+    }
+
+
+def stop():
+    for buf in BUFFERS.values():
+        buf.task.cancel()
+    BUFFERS.clear()
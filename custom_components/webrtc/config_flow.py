@@ -1,4 +1,3 @@
-import asyncio
 import os.path
 import platform
 
@@ -7,8 +6,13 @@ import voluptuous as vol
 import yaml
 from homeassistant.config_entries import ConfigFlow
 from homeassistant.const import CONF_URL, CONF_USERNAME, CONF_PASSWORD
+from homeassistant.helpers.selector import (
+    SelectOptionDict,
+    SelectSelector,
+    SelectSelectorConfig,
+)
 
-from . import DOMAIN, utils
+from . import DOMAIN, SETTINGS, utils
 
 
 class FlowHandler(ConfigFlow, domain=DOMAIN):
@@ -46,22 +50,34 @@ class FlowHandler(ConfigFlow, domain=DOMAIN):
 
             return self.async_create_entry(title="WebRTC Camera", data=user_input)
 
-        # check if go2rtc already exists on same server
-        tests = await asyncio.gather(
-            utils.check_go2rtc(self.hass),
-            # if go2rtc inside frigate addon with closed public port
-            utils.check_go2rtc(self.hass, "http://ccab4aaf-frigate:1984"),
-            utils.check_go2rtc(self.hass, "http://ccab4aaf-frigate-fa:1984"),
-            utils.check_go2rtc(self.hass, "http://ccab4aaf-frigate-beta:1984"),
-        )
+        # check if go2rtc already exists on same server, addons or other hosts
+        urls = utils.DISCOVERY_URLS + SETTINGS["servers"]
+        urls += [utils.discovery_url(host) for host in SETTINGS["discovery"]]
+        servers = await utils.discover_go2rtc(self.hass, urls)
 
-        url = next((url for url in tests if url), vol.UNDEFINED)
+        if not servers:
+            return self.async_show_form(
+                step_id="user",
+                data_schema=vol.Schema({vol.Optional(CONF_URL): cv.string}),
+            )
+
+        options = [
+            SelectOptionDict(
+                value=info["url"],
+                label="{url} (go2rtc {version}, {latency} ms)".format_map(
+                    {**info, "version": info["version"] or "?"}
+                ),
+            )
+            for info in servers
+        ]
 
         return self.async_show_form(
             step_id="user",
             data_schema=vol.Schema(
                 {
-                    vol.Optional(CONF_URL, default=url): cv.string,
+                    vol.Optional(CONF_URL, default=servers[0]["url"]): SelectSelector(
+                        SelectSelectorConfig(options=options, custom_value=True)
+                    ),
                 }
             ),
         )
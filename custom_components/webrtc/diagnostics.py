@@ -0,0 +1,17 @@
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .stats import STATS
+from .utils import DOMAIN, Server, hide_credentials
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict:
+    server = hass.data.get(DOMAIN)
+    if isinstance(server, Server):
+        server = server.diagnostics()
+    else:
+        server = {"url": hide_credentials(server)}
+
+    return {"server": server, "stats": STATS.as_dict()}
@@ -0,0 +1,284 @@
+import asyncio
+import json
+import logging
+
+import aiohttp
+from aiohttp import web
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+
+from . import mp4
+from .utils import WebSocketForward
+
+_LOGGER = logging.getLogger(__name__)
+
+# modes where all viewers receive the same data
+FANOUT_TYPES = ("mse", "mjpeg")
+
+# keep upstream after the last viewer leaves, so page reload will reuse it
+LINGER = 10
+
+# same as video-rtc.js request, so HTTP and WebSocket viewers share upstream
+MJPEG_REQUEST = '{"type":"mjpeg"}'
+
+
+class GopBudget:
+    """Memory limits for keyframe caches of all hubs, 0 - cache disabled."""
+
+    def __init__(self):
+        self.maxsize = 0  # bytes for all streams
+        self.stream_maxsize = 0  # bytes for one stream
+        self.size = 0
+
+
+GOP = GopBudget()
+
+
+def mse_only(mode: str | None) -> bool:
+    """Check card modes, MJPEG is used only if MSE isn't supported."""
+    return bool(mode) and set(mode.split(",")) <= {"mse", "mjpeg"}
+
+
+def fanout_request(msg: aiohttp.WSMessage, types: tuple = FANOUT_TYPES) -> str | None:
+    """Return viewer request if it can be served by the shared upstream."""
+    if msg.type is not aiohttp.WSMsgType.TEXT:
+        return None
+    try:
+        if json.loads(msg.data)["type"] in types:
+            return msg.data
+    except Exception:
+        pass
+    return None
+
+
+class Hub:
+    """One upstream go2rtc WebSocket for all viewers of the same stream with the
+    same request (mode and codecs). Each viewer has own send queue.
+    """
+
+    def __init__(self, hass: HomeAssistant, key: tuple):
+        self.hass = hass
+        self.key = key
+        self.url, self.request = key
+        self.type = json.loads(self.request)["type"]
+
+        self.subscribers: set[WebSocketForward] = set()
+        # upstream answer to the request (MSE codecs) and init segment
+        self.header: str | None = None
+        self.init: bytes | None = None
+        self.streaming = False
+
+        # MSE fragments from the last keyframe, for instant start of new viewers
+        self.gop: list[bytes] = []
+        self.gop_size = 0
+        self.video_tracks: set[int] = set()
+
+        self.linger: asyncio.TimerHandle | None = None
+        self.task = hass.loop.create_task(self.run())
+
+    async def subscribe(self, forward: WebSocketForward):
+        if self.linger:
+            self.linger.cancel()
+            self.linger = None
+
+        if self.header:
+            forward.put_text(self.header)
+        if self.init:
+            await forward.put_binary(self.init)
+
+        if self.gop and self.gop_fits(forward):
+            # late viewer starts from cached keyframe and then catches up live
+            dropped = forward.dropped_messages
+            for data in self.gop:
+                await forward.put_binary(data)
+            # next live fragment should continue GOP without gaps
+            forward.wait_keyframe = forward.dropped_messages != dropped
+        else:
+            # late viewer should start from keyframe
+            forward.wait_keyframe = self.streaming
+        self.subscribers.add(forward)
+
+    def gop_fits(self, forward: WebSocketForward) -> bool:
+        if not forward.max_size:
+            return True
+        return self.gop_size <= forward.max_size - forward.queued_bytes
+
+    def unsubscribe(self, forward: WebSocketForward):
+        # slow viewer is unsubscribed by the hub and then by its session
+        if forward not in self.subscribers:
+            return
+        self.subscribers.discard(forward)
+        if not self.subscribers and not self.task.done():
+            if self.linger:
+                self.linger.cancel()
+            self.linger = self.hass.loop.call_later(LINGER, self.task.cancel)
+
+    async def run(self):
+        try:
+            async with async_get_clientsession(self.hass).ws_connect(self.url) as ws:
+                await ws.send_str(self.request)
+                async for msg in ws:
+                    if msg.type is aiohttp.WSMsgType.TEXT:
+                        self.on_text(msg.data)
+                    elif msg.type is aiohttp.WSMsgType.BINARY:
+                        await self.on_binary(msg.data)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            _LOGGER.debug(f"Fanout upstream exception: {repr(e)}")
+            error = json.dumps({"type": "error", "value": str(e)})
+            for forward in self.subscribers:
+                forward.put_text(error)
+        finally:
+            self.drop_gop()
+            if HUBS.get(self.key) is self:
+                HUBS.pop(self.key)
+            for forward in self.subscribers:
+                forward.close()
+
+    def on_text(self, data: str):
+        if self.header is None and json.loads(data).get("type") == self.type:
+            self.header = data
+        for forward in self.subscribers:
+            forward.put_text(data)
+
+    async def on_binary(self, data: bytes):
+        if mp4.is_init(data):
+            self.init = data
+        else:
+            self.streaming = True
+
+        if self.type == "mse" and GOP.maxsize:
+            self.cache_gop(data)
+
+        for forward in list(self.subscribers):
+            # slow viewer may be disconnected, depending on queue policy
+            if not await forward.put_binary(data):
+                self.unsubscribe(forward)
+
+    def cache_gop(self, data: bytes):
+        if mp4.is_init(data):
+            # new init segment, old fragments can't be decoded with it
+            self.video_tracks = mp4.video_tracks(data)
+            self.drop_gop()
+            return
+
+        if not mp4.is_fragment(data):
+            return
+
+        if mp4.is_keyframe(data, self.video_tracks):
+            self.drop_gop()
+        elif not self.gop:
+            return
+
+        size = len(data)
+        if (
+            self.gop_size + size > GOP.stream_maxsize
+            or GOP.size + size > GOP.maxsize
+        ):
+            # new viewers will wait for the next keyframe, like without cache
+            self.drop_gop()
+            return
+
+        self.gop.append(data)
+        self.gop_size += size
+        GOP.size += size
+
+    def drop_gop(self):
+        GOP.size -= self.gop_size
+        self.gop = []
+        self.gop_size = 0
+
+
+class LatestFrame:
+    """Hub subscriber without queue, for HTTP MJPEG viewers. Keeps only the
+    last frame, so slow viewer skips frames instead of lagging behind.
+    """
+
+    def __init__(self):
+        self.data: bytes | None = None
+        self.event = asyncio.Event()
+        self.closed = False
+        self.wait_keyframe = False
+
+    def put_text(self, data: str):
+        pass
+
+    async def put_binary(self, data: bytes) -> bool:
+        self.data = data
+        self.event.set()
+        return True
+
+    def close(self):
+        self.closed = True
+        self.event.set()
+
+    async def get(self) -> bytes | None:
+        """Wait for new frame, None - upstream closed."""
+        await self.event.wait()
+        self.event.clear()
+        if self.closed:
+            return None
+        data, self.data = self.data, None
+        return data
+
+
+class Consumer:
+    """Hub subscriber for hidden consumers of the stream, like prewarm and
+    buffer, so they share one upstream with each other and with viewers.
+    Data is handled at once, without queue.
+    """
+
+    max_size = 0
+    wait_keyframe = False
+
+    def __init__(self):
+        self.closed = asyncio.Event()
+
+    def put_text(self, data: str):
+        pass
+
+    async def put_binary(self, data: bytes) -> bool:
+        return True
+
+    def close(self):
+        self.closed.set()
+
+    async def consume(self, hass: HomeAssistant, url: str, request: str):
+        """Wait until upstream is closed."""
+        self.closed.clear()
+        hub = await subscribe(hass, url, request, self)
+        try:
+            await self.closed.wait()
+        finally:
+            hub.unsubscribe(self)
+
+
+HUBS: dict[tuple, Hub] = {}
+
+
+async def subscribe(
+    hass: HomeAssistant, url: str, request: str, forward: WebSocketForward
+) -> Hub:
+    key = (url, request)
+    if (hub := HUBS.get(key)) is None:
+        _LOGGER.debug(f"New fanout upstream: {request}")
+        hub = HUBS[key] = Hub(hass, key)
+    await hub.subscribe(forward)
+    return hub
+
+
+async def read_viewer(ws: web.WebSocketResponse, forward: WebSocketForward):
+    """Read viewer messages until it disconnects. Answer with error to requests,
+    which can't be served by shared upstream, like WebRTC offer.
+    """
+    async for msg in ws:
+        if msg.type is not aiohttp.WSMsgType.TEXT:
+            continue
+        try:
+            msg_type = json.loads(msg.data)["type"]
+        except Exception:
+            continue
+        if msg_type not in FANOUT_TYPES and msg_type != "webrtc/candidate":
+            error = f"{msg_type}: not supported in fanout mode"
+            forward.put_text(json.dumps({"type": "error", "value": error}))
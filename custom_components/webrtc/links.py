@@ -0,0 +1,120 @@
+import asyncio
+import heapq
+import logging
+import time
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .utils import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class LinkStore:
+    """Links from create_link and dash_cast services. Expired links are removed
+    in the background by the timer for the nearest expiration time.
+    """
+
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+        # link_id => {"url", "entity", "limit", "ts"}
+        self.links: dict[str, dict] = {}
+        # (expire time, link_id), items for replaced links are skipped on pop
+        self.expires: list[tuple[float, str]] = []
+        self.timer: asyncio.TimerHandle | None = None
+        self.store: Store | None = None
+
+    def __contains__(self, link_id: str) -> bool:
+        return link_id in self.links
+
+    def __len__(self) -> int:
+        return len(self.links)
+
+    async def async_setup(self, hass: HomeAssistant, persist: bool):
+        if not persist:
+            return
+
+        self.store = Store(hass, 1, f"{DOMAIN}_links")
+        if data := await self.store.async_load():
+            self.links.update(data)
+            self.expires = [(v["ts"], k) for k, v in data.items() if v["ts"]]
+            heapq.heapify(self.expires)
+            self.expire()
+
+    def add(self, link_id: str, url: str, entity: str, limit: int, ttl: int):
+        self.links.pop(link_id, None)
+
+        # remove nearest expiring link or oldest link
+        while len(self.links) >= self.maxsize:
+            link_id2 = self.pop_expires() or next(iter(self.links))
+            _LOGGER.debug(f"Remove link {link_id2} because of links limit")
+            self.links.pop(link_id2)
+
+        ts = time.time() + ttl if ttl else 0
+        self.links[link_id] = {"url": url, "entity": entity, "limit": limit, "ts": ts}
+
+        if ts:
+            heapq.heappush(self.expires, (ts, link_id))
+            self.schedule()
+
+        self.save()
+
+    def use(self, link_id: str) -> dict | None:
+        """Return link and decrease its open limit. Return None if link expired."""
+        link = self.links[link_id]
+        if link["ts"] and time.time() > link["ts"]:
+            self.links.pop(link_id)
+            self.save()
+            return None
+
+        if link["limit"]:
+            link["limit"] -= 1
+            if link["limit"] == 0:
+                self.links.pop(link_id)
+            self.save()
+
+        return link
+
+    def pop_expires(self) -> str | None:
+        """Pop nearest expiration item for existing link."""
+        while self.expires:
+            ts, link_id = heapq.heappop(self.expires)
+            if (link := self.links.get(link_id)) and link["ts"] == ts:
+                return link_id
+        return None
+
+    def expire(self):
+        self.timer = None
+
+        now = time.time()
+        changed = False
+        while self.expires and self.expires[0][0] <= now:
+            ts, link_id = heapq.heappop(self.expires)
+            if (link := self.links.get(link_id)) and link["ts"] == ts:
+                self.links.pop(link_id)
+                changed = True
+
+        if changed:
+            self.save()
+
+        self.schedule()
+
+    def schedule(self):
+        if not self.expires:
+            return
+
+        loop = asyncio.get_running_loop()
+        when = loop.time() + max(self.expires[0][0] - time.time(), 0)
+
+        if self.timer:
+            # timer already set for nearest expiration
+            if self.timer.when() <= when:
+                return
+            self.timer.cancel()
+
+        self.timer = loop.call_at(when, self.expire)
+
+    def save(self):
+        if self.store:
+            self.store.async_delay_save(lambda: self.links, 1)
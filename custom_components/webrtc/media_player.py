@@ -1,3 +1,6 @@
+import asyncio
+import logging
+import time
 from datetime import timedelta
 
 import voluptuous as vol
@@ -10,13 +13,19 @@ from homeassistant.components.media_player import (
     PLATFORM_SCHEMA,
 )
 from homeassistant.const import STATE_PLAYING, STATE_IDLE, CONF_NAME
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant.helpers.reload import async_setup_reload_service
 from homeassistant.helpers.typing import ConfigType
+from homeassistant.helpers.update_coordinator import (
+    CoordinatorEntity,
+    DataUpdateCoordinator,
+    UpdateFailed,
+)
 
 from . import utils
+from .audio import AudioStream
 from .utils import DOMAIN
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
@@ -24,25 +33,89 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
         vol.Required(CONF_NAME): cv.string,
         vol.Required("stream"): cv.string,
         vol.Required("audio"): cv.string,
+        vol.Optional("streaming", default=False): cv.boolean,
     },
     extra=vol.REMOVE_EXTRA,
 )
 
+_LOGGER = logging.getLogger(__name__)
+
 SCAN_INTERVAL = timedelta(seconds=60)
+# while something is playing and after play or stop commands
+FAST_SCAN_INTERVAL = timedelta(seconds=1)
+FAST_SCAN_TIME = 10
+# seconds for go2rtc to connect to the audio stream
+AUDIO_START_TIMEOUT = 10
+
+COORDINATOR: "StreamsCoordinator | None" = None
 
 
 async def async_setup_platform(
     hass: HomeAssistant, config: ConfigType, async_add_entities, discovery_info=None
 ) -> None:
+    global COORDINATOR
+
     await async_setup_reload_service(hass, DOMAIN, ["media_player"])
 
-    player = WebRTCPlayer(**config)
+    if COORDINATOR is None:
+        COORDINATOR = StreamsCoordinator(hass)
+
+    player = WebRTCPlayer(COORDINATOR, **config)
 
     async_add_entities([player])
 
 
-class WebRTCPlayer(MediaPlayerEntity):
-    def __init__(self, name: str, stream: str, audio: str, **kwargs):
+def is_playing(info: dict | None) -> bool:
+    return bool(info) and any("type" in p for p in info.get("producers") or [])
+
+
+class StreamsCoordinator(DataUpdateCoordinator):
+    """State of all players with one api/streams request. go2rtc doesn't push
+    stream events, so streams are polled every second while any player is
+    playing or just got a command, and every minute otherwise. Playback started
+    outside of Hass is noticed only by the slow poll.
+    """
+
+    def __init__(self, hass: HomeAssistant):
+        super().__init__(
+            hass, _LOGGER, name="WebRTC players", update_interval=SCAN_INTERVAL
+        )
+        self.streams: set[str] = set()
+        self.fast_until = 0
+
+    async def _async_update_data(self) -> dict:
+        fast = time.monotonic() < self.fast_until
+        self.update_interval = FAST_SCAN_INTERVAL if fast else SCAN_INTERVAL
+
+        try:
+            r = await async_get_clientsession(self.hass).get(
+                utils.api_streams(self.hass), timeout=9
+            )
+            data = await r.json(content_type=None)
+        except Exception as e:
+            raise UpdateFailed(repr(e))
+
+        if any(is_playing(data.get(stream)) for stream in self.streams):
+            self.update_interval = FAST_SCAN_INTERVAL
+
+        return data
+
+    async def async_command_sent(self):
+        self.fast_until = time.monotonic() + FAST_SCAN_TIME
+        await self.async_refresh()
+
+
+class WebRTCPlayer(CoordinatorEntity, MediaPlayerEntity):
+    def __init__(
+        self,
+        coordinator: StreamsCoordinator,
+        name: str,
+        stream: str,
+        audio: str,
+        streaming: bool = False,
+        **kwargs,
+    ):
+        super().__init__(coordinator)
         self._attr_supported_features = (
             MediaPlayerEntityFeature.PLAY_MEDIA
             | MediaPlayerEntityFeature.BROWSE_MEDIA
@@ -51,6 +124,13 @@ class WebRTCPlayer(MediaPlayerEntity):
         self._attr_name = name
         self._attr_unique_id = stream
         self.audio = audio
+        # one long-lived go2rtc producer and announcements queue
+        self.audio_stream = (
+            AudioStream(coordinator.hass, self.on_audio_change, self.play_ffmpeg)
+            if streaming
+            else None
+        )
+        self.audio_lock = asyncio.Lock()
 
     async def async_play_media(self, media_type: str, media_id: str, **kwargs) -> None:
         if media_source.is_media_source_id(media_id):
@@ -60,6 +140,19 @@ class WebRTCPlayer(MediaPlayerEntity):
             media_id = sourced_media.url
 
         media_id = async_process_play_media_url(self.hass, media_id)
+
+        if self.audio_stream:
+            # calls before go2rtc connects shouldn't start more producers
+            async with self.audio_lock:
+                if not self.audio_stream.connected:
+                    await self.start_audio_stream()
+            self.audio_stream.play(media_id)
+            return
+
+        await self.play_ffmpeg(media_id, media_type)
+
+    async def play_ffmpeg(self, media_id: str, media_type: str = ""):
+        """Play with own ffmpeg producer, it replaces current producer."""
         if not media_type.startswith("#"):
             media_type = "#input=file"
 
@@ -73,7 +166,36 @@ class WebRTCPlayer(MediaPlayerEntity):
         )
         assert r.ok
 
+        await self.coordinator.async_command_sent()
+
+    async def start_audio_stream(self):
+        waiter = self.audio_stream.connect_waiter()
+        url = async_process_play_media_url(self.hass, self.audio_stream.path)
+        r = await async_get_clientsession(self.hass).post(
+            utils.api_streams(self.hass),
+            params={"dst": self.unique_id, "src": f"ffmpeg:{url}#audio={self.audio}"},
+            timeout=9,
+        )
+        assert r.ok
+
+        await self.coordinator.async_command_sent()
+
+        try:
+            await asyncio.wait_for(waiter, AUDIO_START_TIMEOUT)
+        except asyncio.TimeoutError:
+            _LOGGER.warning(f"go2rtc didn't connect to audio stream: {self.entity_id}")
+
+    @callback
+    def on_audio_change(self):
+        if self.hass:
+            self._handle_coordinator_update()
+
     async def async_media_stop(self) -> None:
+        if self.audio_stream:
+            # keep producer, it will be closed after idle timeout
+            self.audio_stream.stop()
+            return
+
         r = await async_get_clientsession(self.hass).post(
             utils.api_streams(self.hass),
             params={"dst": self.unique_id, "src": ""},
@@ -81,17 +203,33 @@ class WebRTCPlayer(MediaPlayerEntity):
         )
         assert r.ok
 
-    async def async_update(self):
-        try:
-            r = await async_get_clientsession(self.hass).get(
-                utils.api_streams(self.hass), params={"src": self.unique_id}, timeout=9
-            )
-            self._attr_available = r.ok
-            resp = await r.json(content_type=None)
-            playing = any("type" in p for p in resp["producers"])
-            self._attr_state = STATE_PLAYING if playing else STATE_IDLE
-        except:
-            pass
+        await self.coordinator.async_command_sent()
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self.coordinator.streams.add(self.unique_id)
+        if self.coordinator.data is None:
+            await self.coordinator.async_refresh()
+        self._handle_coordinator_update()
+
+    async def async_will_remove_from_hass(self) -> None:
+        await super().async_will_remove_from_hass()
+        self.coordinator.streams.discard(self.unique_id)
+        if self.audio_stream:
+            self.audio_stream.close()
+
+    @property
+    def available(self) -> bool:
+        return super().available and self.unique_id in (self.coordinator.data or {})
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        if self.audio_stream:
+            playing = self.audio_stream.busy
+        else:
+            playing = is_playing((self.coordinator.data or {}).get(self.unique_id))
+        self._attr_state = STATE_PLAYING if playing else STATE_IDLE
+        super()._handle_coordinator_update()
 
     async def async_browse_media(
         self, media_content_type: str = None, media_content_id: str = None
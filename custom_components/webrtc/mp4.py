@@ -0,0 +1,109 @@
+from typing import Iterator
+
+# https://developer.apple.com/documentation/quicktime-file-format
+SAMPLE_IS_NON_SYNC = 0x00010000
+
+TFHD_BASE_DATA_OFFSET = 0x01
+TFHD_SAMPLE_DESCRIPTION_INDEX = 0x02
+TFHD_DEFAULT_SAMPLE_DURATION = 0x08
+TFHD_DEFAULT_SAMPLE_SIZE = 0x10
+TFHD_DEFAULT_SAMPLE_FLAGS = 0x20
+
+TRUN_DATA_OFFSET = 0x01
+TRUN_FIRST_SAMPLE_FLAGS = 0x04
+TRUN_SAMPLE_DURATION = 0x100
+TRUN_SAMPLE_SIZE = 0x200
+TRUN_SAMPLE_FLAGS = 0x400
+
+
+def uint32(data: bytes, offset: int) -> int:
+    return int.from_bytes(data[offset : offset + 4], "big")
+
+
+def iter_boxes(data: bytes, start: int = 0, end: int = None) -> Iterator[tuple]:
+    """Yield (type, payload start, box end) for each box in data[start:end]."""
+    if end is None:
+        end = len(data)
+    while start + 8 <= end:
+        size = uint32(data, start)
+        if size < 8 or start + size > end:
+            return
+        yield data[start + 4 : start + 8], start + 8, start + size
+        start += size
+
+
+def find_boxes(data: bytes, path: tuple, start: int = 0, end: int = None):
+    """Yield (payload start, box end) for all boxes with this path."""
+    for box, payload, box_end in iter_boxes(data, start, end):
+        if box != path[0]:
+            continue
+        if len(path) == 1:
+            yield payload, box_end
+        else:
+            yield from find_boxes(data, path[1:], payload, box_end)
+
+
+def is_init(data: bytes) -> bool:
+    return data[4:8] == b"ftyp"
+
+
+def is_fragment(data: bytes) -> bool:
+    return data[4:8] == b"moof"
+
+
+def video_tracks(init: bytes) -> set[int]:
+    """Return IDs of video tracks from init segment (ftyp + moov)."""
+    tracks = set()
+    for trak, trak_end in find_boxes(init, (b"moov", b"trak")):
+        handler = next(find_boxes(init, (b"mdia", b"hdlr"), trak, trak_end), None)
+        if handler is None or init[handler[0] + 8 : handler[0] + 12] != b"vide":
+            continue
+        for tkhd, _ in find_boxes(init, (b"tkhd",), trak, trak_end):
+            # version 1 has 64-bit creation and modification time
+            offset = 20 if init[tkhd] == 1 else 12
+            tracks.add(uint32(init, tkhd + offset))
+    return tracks
+
+
+def is_keyframe(data: bytes, tracks: set[int] = None) -> bool:
+    """Check if fragment starts from sync sample of video track. Audio fragments
+    are not keyframes if init segment has video tracks.
+    """
+    for traf, traf_end in find_boxes(data, (b"moof", b"traf")):
+        flags = None
+
+        for tfhd, _ in find_boxes(data, (b"tfhd",), traf, traf_end):
+            if tracks and uint32(data, tfhd + 4) not in tracks:
+                return False
+
+            tf_flags = uint32(data, tfhd) & 0xFFFFFF
+            offset = tfhd + 8
+            if tf_flags & TFHD_BASE_DATA_OFFSET:
+                offset += 8
+            for flag in (
+                TFHD_SAMPLE_DESCRIPTION_INDEX,
+                TFHD_DEFAULT_SAMPLE_DURATION,
+                TFHD_DEFAULT_SAMPLE_SIZE,
+            ):
+                if tf_flags & flag:
+                    offset += 4
+            if tf_flags & TFHD_DEFAULT_SAMPLE_FLAGS:
+                flags = uint32(data, offset)
+
+        for trun, _ in find_boxes(data, (b"trun",), traf, traf_end):
+            tr_flags = uint32(data, trun) & 0xFFFFFF
+            offset = trun + 8
+            if tr_flags & TRUN_DATA_OFFSET:
+                offset += 4
+            if tr_flags & TRUN_FIRST_SAMPLE_FLAGS:
+                flags = uint32(data, offset)
+            elif tr_flags & TRUN_SAMPLE_FLAGS:
+                if tr_flags & TRUN_SAMPLE_DURATION:
+                    offset += 4
+                if tr_flags & TRUN_SAMPLE_SIZE:
+                    offset += 4
+                flags = uint32(data, offset)
+
+        return flags is not None and not flags & SAMPLE_IS_NON_SYNC
+
+    return False
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+
+from homeassistant.core import HomeAssistant
+
+from .fanout import Consumer
+from .utils import RESTART_DELAY, RESTART_DELAY_MAX, SERVERS
+
+_LOGGER = logging.getLogger(__name__)
+
+# go2rtc keeps stream producer connected only while it has consumers
+MSE_REQUEST = (
+    '{"type":"mse","value":"avc1.640029,avc1.64002A,avc1.640033,'
+    'hvc1.1.6.L153.B0,mp4a.40.2,mp4a.40.5,flac,opus"}'
+)
+
+
+class Warm(Consumer):
+    """Hidden consumer of the stream, so viewers don't wait for the camera
+    connection. Released after idle timeout without viewers, None - never.
+    """
+
+    def __init__(self, hass: HomeAssistant, server: str, url: str, timeout: int | None):
+        super().__init__()
+        self.hass = hass
+        self.server = server
+        self.url = url
+        self.timeout = timeout
+        self.connected = False
+        self.viewers = 0
+
+        self.expire = hass.loop.time() + timeout if timeout else None
+        self.timer: asyncio.TimerHandle | None = None
+        self.task = hass.loop.create_task(self.run())
+        self.schedule()
+
+    def extend(self, timeout: int | None):
+        if self.expire is None:
+            return
+        if not timeout:
+            self.timeout = self.expire = None
+        else:
+            self.timeout = max(self.timeout, timeout)
+            self.expire = max(self.expire, self.hass.loop.time() + timeout)
+        self.schedule()
+
+    def join(self):
+        self.viewers += 1
+        self.schedule()
+
+    def leave(self):
+        self.viewers -= 1
+        if self.expire is not None:
+            self.expire = max(self.expire, self.hass.loop.time() + self.timeout)
+        self.schedule()
+
+    def schedule(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        if self.expire is not None and not self.viewers:
+            self.timer = self.hass.loop.call_at(self.expire, self.task.cancel)
+
+    async def put_binary(self, data: bytes) -> bool:
+        self.connected = True
+        return True
+
+    async def run(self):
+        delay = RESTART_DELAY
+        try:
+            while True:
+                await self.consume(self.hass, self.url, MSE_REQUEST)
+
+                if self.connected:
+                    delay = RESTART_DELAY
+                self.connected = False
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RESTART_DELAY_MAX)
+        finally:
+            self.connected = False
+            for src, warm in list(WARM.items()):
+                if warm is self:
+                    WARM.pop(src)
+
+
+# stream source => Warm
+WARM: dict[str, Warm] = {}
+
+
+def prewarm(hass: HomeAssistant, src: str, server: str, url: str, timeout: int | None):
+    if warm := WARM.get(src):
+        warm.extend(timeout)
+    else:
+        _LOGGER.debug(f"Prewarm stream for {timeout} seconds: {url}")
+        WARM[src] = Warm(hass, server, url, timeout)
+
+
+def get_server(src: str) -> str | None:
+    """Viewers of the prewarmed stream should use the same go2rtc server."""
+    if (warm := WARM.get(src)) and warm.server in SERVERS.urls():
+        return warm.server
+    return None
+
+
+def find(url: str) -> Warm | None:
+    return next((warm for warm in WARM.values() if warm.url == url), None)
+
+
+def stop():
+    for warm in list(WARM.values()):
+        warm.task.cancel()
@@ -0,0 +1,95 @@
+from datetime import timedelta
+
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorStateClass,
+)
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import UnitOfInformation, UnitOfTime
+from homeassistant.core import HomeAssistant
+
+from .admission import ADMISSION
+from .stats import STATS
+
+SCAN_INTERVAL = timedelta(seconds=10)
+
+
+async def async_setup_entry(
+    hass: HomeAssistant, entry: ConfigEntry, async_add_entities
+) -> None:
+    async_add_entities(
+        [
+            ActiveSessionsSensor(entry),
+            RejectedSessionsSensor(entry),
+            BytesSensor(entry, "bytes_out", "Sent"),
+            BytesSensor(entry, "bytes_in", "Received"),
+            TimingSensor(entry, "setup", "Setup time"),
+            TimingSensor(entry, "first_frame", "First frame time"),
+            TimingSensor(entry, "first_frame_warm", "First frame time (warm)"),
+            TimingSensor(entry, "first_frame_cold", "First frame time (cold)"),
+        ]
+    )
+
+
+class StatsSensor(SensorEntity):
+    _attr_should_poll = True
+
+    def __init__(self, entry: ConfigEntry, key: str, name: str):
+        self._attr_name = "WebRTC " + name
+        self._attr_unique_id = f"{entry.entry_id}_{key}"
+        self.key = key
+
+
+class ActiveSessionsSensor(StatsSensor):
+    _attr_icon = "mdi:video-account"
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, entry: ConfigEntry):
+        super().__init__(entry, "active", "Active sessions")
+
+    async def async_update(self):
+        self._attr_native_value = len(STATS.active)
+        self._attr_extra_state_attributes = {
+            src: sum(1 for s in STATS.active if s.src == src)
+            for src in {s.src for s in STATS.active}
+        }
+
+
+class RejectedSessionsSensor(StatsSensor):
+    _attr_icon = "mdi:video-off"
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+
+    def __init__(self, entry: ConfigEntry):
+        super().__init__(entry, "rejected", "Rejected sessions")
+
+    async def async_update(self):
+        self._attr_native_value = sum(ADMISSION.rejected.values())
+        self._attr_extra_state_attributes = {
+            "admitted": ADMISSION.admitted,
+            "queued": ADMISSION.queued,
+            "waiting": ADMISSION.waiting,
+            **ADMISSION.rejected,
+        }
+
+
+class BytesSensor(StatsSensor):
+    _attr_device_class = SensorDeviceClass.DATA_SIZE
+    _attr_native_unit_of_measurement = UnitOfInformation.BYTES
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+    _attr_suggested_unit_of_measurement = UnitOfInformation.MEGABYTES
+
+    async def async_update(self):
+        self._attr_native_value = STATS.totals()[self.key]
+
+
+class TimingSensor(StatsSensor):
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    async def async_update(self):
+        if self.key == "setup":
+            self._attr_native_value = STATS.setup_time
+        else:
+            self._attr_native_value = STATS.timing(self.key)
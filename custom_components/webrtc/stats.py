@@ -0,0 +1,161 @@
+import time
+
+from .admission import ADMISSION
+from .fanout import GOP
+from .prewarm import WARM
+from .utils import SERVERS, SIGN_REJECTS, Cache, WebSocketForward, hide_credentials
+
+COUNTERS = ("sessions", "bytes_in", "bytes_out", "messages_in", "messages_out")
+
+# history of closed sessions for each source and client, older groups are removed
+GROUPS_MAXSIZE = 1000
+GROUPS_TTL = 24 * 3600
+
+
+class Session:
+    """Statistics of one proxied WebSocket session. Direction `in` is from the
+    browser to go2rtc, direction `out` is from go2rtc to the browser.
+    """
+
+    def __init__(self):
+        self.ts = time.monotonic()
+        self.src: str | None = None
+        self.remote: str | None = None
+        self.server: str | None = None
+        # stream was prewarmed before session start
+        self.warm = False
+        # setup stages durations in seconds
+        self.timings: dict[str, float] = {}
+        self.forward_in: WebSocketForward | None = None
+        self.forward_out: WebSocketForward | None = None
+        self.last_mark = self.ts
+
+    def mark(self, stage: str):
+        now = time.monotonic()
+        self.timings[stage] = now - self.last_mark
+        self.last_mark = now
+
+    @property
+    def first_frame(self) -> float | None:
+        if self.forward_out and self.forward_out.first_frame:
+            return self.forward_out.first_frame - self.ts
+        return None
+
+    def counters(self) -> dict:
+        fin, fout = self.forward_in, self.forward_out
+        return {
+            "sessions": 1,
+            "bytes_in": fin.bytes if fin else 0,
+            "bytes_out": fout.bytes if fout else 0,
+            "messages_in": fin.messages if fin else 0,
+            "messages_out": fout.messages if fout else 0,
+        }
+
+    def as_dict(self) -> dict:
+        timings = {k: round(v * 1000) for k, v in self.timings.items()}
+        if first_frame := self.first_frame:
+            timings["first_frame"] = round(first_frame * 1000)
+        return {
+            "src": self.src,
+            "remote": self.remote,
+            "server": self.server,
+            "warm": self.warm,
+            "duration": round(time.monotonic() - self.ts),
+            "timings": timings,
+            "queued_bytes": self.forward_out.queued_bytes if self.forward_out else 0,
+            "dropped_out": self.forward_out.dropped_messages if self.forward_out else 0,
+            **self.counters(),
+        }
+
+
+def add_counters(total: dict, counters: dict):
+    for k in COUNTERS:
+        total[k] = total.get(k, 0) + counters[k]
+
+
+class Stats:
+    """Aggregated statistics of all proxied WebSocket sessions."""
+
+    def __init__(self):
+        self.active: set[Session] = set()
+        # counters of closed sessions
+        self.closed: dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        self.closed_by_src = Cache(GROUPS_MAXSIZE, lambda _: 1)
+        self.closed_by_remote = Cache(GROUPS_MAXSIZE, lambda _: 1)
+        # stage => [count, sum of seconds]
+        self.timings: dict[str, list] = {}
+
+    def start(self, session: Session):
+        self.active.add(session)
+        for stage, value in session.timings.items():
+            self.add_timing(stage, value)
+
+    def stop(self, session: Session):
+        self.active.discard(session)
+        if first_frame := session.first_frame:
+            self.add_timing("first_frame", first_frame)
+            stage = "first_frame_warm" if session.warm else "first_frame_cold"
+            self.add_timing(stage, first_frame)
+
+        counters = session.counters()
+        add_counters(self.closed, counters)
+        for closed, key in (
+            (self.closed_by_src, session.src),
+            (self.closed_by_remote, session.remote),
+        ):
+            group = closed.get(key) or {}
+            add_counters(group, counters)
+            closed.set(key, group, GROUPS_TTL)
+
+    def add_timing(self, stage: str, value: float):
+        item = self.timings.setdefault(stage, [0, 0.0])
+        item[0] += 1
+        item[1] += value
+
+    def timing(self, stage: str) -> float | None:
+        """Average stage duration in milliseconds."""
+        if item := self.timings.get(stage):
+            return round(item[1] / item[0] * 1000, 1)
+        return None
+
+    @property
+    def setup_time(self) -> float | None:
+        times = [self.timing(k) for k in ("sign", "connect", "handshake")]
+        return round(sum(t for t in times if t), 1) if any(times) else None
+
+    def totals(self) -> dict:
+        total = dict(self.closed)
+        for session in self.active:
+            add_counters(total, session.counters())
+        return total
+
+    def grouped(self, attr: str) -> dict:
+        closed = self.closed_by_src if attr == "src" else self.closed_by_remote
+        groups = {}
+        for key in list(closed.items):
+            if group := closed.get(key):
+                groups[key] = dict(group)
+        for session in self.active:
+            add_counters(groups.setdefault(getattr(session, attr), {}), session.counters())
+        return groups
+
+    def as_dict(self) -> dict:
+        return {
+            "active": len(self.active),
+            "totals": self.totals(),
+            "timings": {k: self.timing(k) for k in self.timings},
+            "rejected": {"sign": dict(SIGN_REJECTS)},
+            "admission": ADMISSION.as_dict(),
+            "servers": SERVERS.as_dict(),
+            "prewarm": {
+                hide_credentials(src): {"connected": w.connected, "viewers": w.viewers}
+                for src, w in WARM.items()
+            },
+            "gop_cache": {"size": GOP.size, "maxsize": GOP.maxsize},
+            "sources": self.grouped("src"),
+            "clients": self.grouped("remote"),
+            "sessions": [session.as_dict() for session in self.active],
+        }
+
+
+STATS = Stats()
@@ -1,18 +1,23 @@
+import asyncio
+import gzip
+import hashlib
 import io
+import json
 import logging
 import os
 import platform
 import re
+import shutil
 import stat
 import subprocess
+import time
 import zipfile
-from threading import Thread
-from typing import Optional
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
 from urllib.parse import urljoin
 
 import aiohttp
 import jwt
-import requests
 from aiohttp import web
 from homeassistant.components.frontend import add_extra_js_url
 from homeassistant.components.http.auth import DATA_SIGN_SECRET, SIGN_QUERY_PARAM
@@ -22,7 +27,10 @@ from homeassistant.core import HomeAssistant
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant.helpers.entity_component import DATA_INSTANCES
 
+from . import mp4
+
 _LOGGER = logging.getLogger(__name__)
+_GO2RTC_LOGGER = _LOGGER.getChild("go2rtc")
 
 DOMAIN = "webrtc"
 
@@ -45,10 +53,121 @@ SYSTEM = {
 
 DEFAULT_URL = "http://localhost:1984/"
 
+RELEASES_URL = "https://github.com/AlexxIT/go2rtc/releases"
+RELEASES_API = "https://api.github.com/repos/AlexxIT/go2rtc/releases"
+
+# hash and version of checked binary, so no need to run it on each start
+BINARY_STAMP = ".go2rtc.json"
+
+# go2rtc restart backoff in seconds
+RESTART_DELAY = 1
+RESTART_DELAY_MAX = 60
+RESTART_DELAY_RESET = 60
+STOP_TIMEOUT = 5
+
+# go2rtc log lines per second
+LOG_RATE = 20
+LOG_BURST = 100
+LOG_LEVELS = {
+    "TRC": logging.DEBUG,
+    "DBG": logging.DEBUG,
+    "INF": logging.INFO,
+    "WRN": logging.WARNING,
+    "ERR": logging.ERROR,
+    "FTL": logging.CRITICAL,
+    "PNC": logging.CRITICAL,
+}
+
+# seconds between go2rtc servers health checks
+HEALTH_INTERVAL = 15
+
+# go2rtc addon and go2rtc inside frigate addons with closed public port
+DISCOVERY_URLS = [
+    DEFAULT_URL,
+    "http://a889bffc-go2rtc:1984/",
+    "http://ccab4aaf-frigate:1984/",
+    "http://ccab4aaf-frigate-fa:1984/",
+    "http://ccab4aaf-frigate-beta:1984/",
+]
+DISCOVERY_TIMEOUT = 2
+# wait for other servers after the first one is found, so the user can choose
+DISCOVERY_GRACE = 0.3
+
+RE_CREDENTIALS = re.compile(r"//[^/]*@")
+
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=600, sock_read=60)
+
 BINARY_NAME = re.compile(
     r"^(go2rtc-\d\.\d\.\d+|go2rtc_v0\.1-rc\.[5-9]|rtsp2webrtc_v[1-5])(\.exe)?$"
 )
 
+# card modules, dependencies first and the card last
+BUNDLE_MODULES = ("video-rtc.js", "digital-ptz.js", "webrtc-camera.js")
+RE_IMPORT = re.compile(r"^import .+ from '\./.+';\n", re.M)
+RE_EXPORT = re.compile(r"^export (class|function|const|let) (\w+)", re.M)
+
+
+class Cache:
+    """LRU cache with TTL for each item and limit for total items size."""
+
+    def __init__(self, maxsize: int, sizeof=len):
+        self.maxsize = maxsize
+        self.sizeof = sizeof
+        self.size = 0
+        # key => (expire time, item size, value)
+        self.items: OrderedDict[str, tuple] = OrderedDict()
+
+    def get(self, key: str, default=None):
+        item = self.items.get(key)
+        if item is None:
+            return default
+
+        if item[0] < time.monotonic():
+            self.pop(key)
+            return default
+
+        self.items.move_to_end(key)
+        return item[2]
+
+    def set(self, key: str, value, ttl: float):
+        self.pop(key)
+
+        size = self.sizeof(value)
+        if size > self.maxsize:
+            return
+
+        self.items[key] = (time.monotonic() + ttl, size, value)
+        self.size += size
+
+        # remove least recently used items
+        while self.size > self.maxsize:
+            _, item = self.items.popitem(last=False)
+            self.size -= item[1]
+
+    def pop(self, key: str):
+        if item := self.items.pop(key, None):
+            self.size -= item[1]
+            return item[2]
+
+    def clear(self):
+        self.items.clear()
+        self.size = 0
+
+
+class SingleFlight:
+    """Run only one call for each key, concurrent callers wait for its result."""
+
+    def __init__(self):
+        self.tasks: dict[str, asyncio.Task] = {}
+
+    async def run(self, key: str, func: Callable[[], Awaitable]):
+        if (task := self.tasks.get(key)) is None:
+            task = self.tasks[key] = asyncio.create_task(func())
+            task.add_done_callback(lambda _: self.tasks.pop(key, None))
+        # canceled caller shouldn't cancel the call for other callers
+        return await asyncio.shield(task)
+
 
 def get_arch() -> Optional[str]:
     system = SYSTEM.get(platform.system())
@@ -57,55 +176,147 @@ def get_arch() -> Optional[str]:
     return system.get(platform.machine())
 
 
-def unzip(content: bytes) -> bytes:
-    with zipfile.ZipFile(io.BytesIO(content)) as zf:
-        for filename in zf.namelist():
-            with zf.open(filename) as f:
-                return f.read()
+def binary_sha256(filename: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(filename, "rb") as f:
+        while chunk := f.read(DOWNLOAD_CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
 
 
-def validate_binary(hass: HomeAssistant) -> Optional[str]:
-    filename = f"go2rtc-{BINARY_VERSION}"
-    if platform.system() == "Windows":
-        filename += ".exe"
+def check_binary(filename: str, stamp: str) -> bool:
+    """Check binary with `-v` only if its hash differs from the stamp file."""
+    if not os.path.isfile(filename):
+        return False
 
-    filename = hass.config.path(filename)
+    sha256 = binary_sha256(filename)
     try:
-        if os.path.isfile(filename) and subprocess.check_output(
-            [filename, "-v"]
-        ).startswith(b"go2rtc"):
-            return filename
-    except:
+        with open(stamp) as f:
+            if json.load(f)["sha256"] == sha256:
+                return True
+    except Exception:
         pass
 
-    # remove all old binaries
-    for file in os.listdir(hass.config.config_dir):
+    try:
+        version = subprocess.check_output([filename, "-v"])
+        if not version.startswith(b"go2rtc"):
+            return False
+    except Exception:
+        return False
+
+    with open(stamp, "w") as f:
+        json.dump({"sha256": sha256, "version": version.decode().strip()}, f)
+
+    return True
+
+
+def remove_old_binaries(config_dir: str):
+    for file in os.listdir(config_dir):
         if BINARY_NAME.match(file):
             _LOGGER.debug(f"Remove old binary: {file}")
-            os.remove(hass.config.path(file))
+            os.remove(os.path.join(config_dir, file))
 
-    # download new binary
-    url = (
-        f"https://github.com/AlexxIT/go2rtc/releases/download/"
-        f"v{BINARY_VERSION}/{get_arch()}"
-    )
-    _LOGGER.debug(f"Download new binary: {url}")
-    r = requests.get(url)
-    if not r.ok:
-        return None
 
-    raw = r.content
+def unzip(zipname: str, filename: str):
+    """Extract first file from zip archive without loading it to memory."""
+    with zipfile.ZipFile(zipname) as zf:
+        with zf.open(zf.namelist()[0]) as fsrc, open(filename, "wb") as fdst:
+            shutil.copyfileobj(fsrc, fdst, DOWNLOAD_CHUNK_SIZE)
 
-    # unzip binary for windows
-    if url.endswith(".zip"):
-        raw = unzip(raw)
 
-    # save binary to config folder
-    with open(filename, "wb") as f:
-        f.write(raw)
+def install_binary(tmpname: str, filename: str, is_zip: bool):
+    if is_zip:
+        zipname, tmpname = tmpname, tmpname + ".bin"
+        unzip(zipname, tmpname)
+        os.remove(zipname)
 
     # change binary access rights
-    os.chmod(filename, os.stat(filename).st_mode | stat.S_IEXEC)
+    os.chmod(tmpname, os.stat(tmpname).st_mode | stat.S_IEXEC)
+    # atomic replace, so there will never be a partial binary
+    os.replace(tmpname, filename)
+
+
+async def get_release_sha256(session: aiohttp.ClientSession, asset: str) -> str | None:
+    """Get asset checksum from GitHub release, if GitHub has it."""
+    url = f"{RELEASES_API}/tags/v{BINARY_VERSION}"
+    try:
+        async with session.get(url, timeout=10) as r:
+            release = await r.json()
+        for item in release["assets"]:
+            if item["name"] == asset and item.get("digest", "").startswith("sha256:"):
+                return item["digest"][7:]
+    except Exception as e:
+        _LOGGER.debug(f"Can't get release checksum: {repr(e)}")
+    return None
+
+
+async def download_binary(
+    session: aiohttp.ClientSession, url: str, filename: str, sha256: str = None
+) -> bool:
+    """Download binary by chunks to temp file, verify it and move to filename."""
+    loop = asyncio.get_running_loop()
+    tmpname = filename + ".tmp"
+    hasher = hashlib.sha256()
+
+    try:
+        async with session.get(url, timeout=DOWNLOAD_TIMEOUT) as r:
+            if not r.ok:
+                _LOGGER.warning(f"Can't download binary: {r.status} {url}")
+                return False
+
+            f = await loop.run_in_executor(None, open, tmpname, "wb")
+            try:
+                async for chunk in r.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    hasher.update(chunk)
+                    await loop.run_in_executor(None, f.write, chunk)
+            finally:
+                await loop.run_in_executor(None, f.close)
+
+        if sha256 and hasher.hexdigest() != sha256:
+            raise Exception(f"wrong checksum {hasher.hexdigest()}")
+
+        await loop.run_in_executor(
+            None, install_binary, tmpname, filename, url.endswith(".zip")
+        )
+        return True
+
+    except Exception as e:
+        _LOGGER.warning(f"Can't download binary: {repr(e)}")
+        await loop.run_in_executor(None, remove_file, tmpname)
+        return False
+
+
+def remove_file(filename: str):
+    if os.path.isfile(filename):
+        os.remove(filename)
+
+
+async def validate_binary(hass: HomeAssistant) -> Optional[str]:
+    filename = f"go2rtc-{BINARY_VERSION}"
+    if platform.system() == "Windows":
+        filename += ".exe"
+
+    filename = hass.config.path(filename)
+    stamp = hass.config.path(BINARY_STAMP)
+
+    if await hass.async_add_executor_job(check_binary, filename, stamp):
+        return filename
+
+    # remove all old binaries
+    await hass.async_add_executor_job(remove_old_binaries, hass.config.config_dir)
+
+    # download new binary
+    arch = get_arch()
+    url = f"{RELEASES_URL}/download/v{BINARY_VERSION}/{arch}"
+    _LOGGER.debug(f"Download new binary: {url}")
+
+    session = async_get_clientsession(hass)
+    sha256 = await get_release_sha256(session, arch)
+    if not await download_binary(session, url, filename, sha256):
+        return None
+
+    if not await hass.async_add_executor_job(check_binary, filename, stamp):
+        return None
 
     return filename
 
@@ -121,11 +332,12 @@ async def register_static_path(hass: HomeAssistant, url_path: str, path: str):
         hass.http.register_static_path(url_path, path)
 
 
-async def init_resource(hass: HomeAssistant, url: str, ver: str) -> bool:
+async def init_resource(hass: HomeAssistant, prefix: str, url: str) -> bool:
     """Add extra JS module for lovelace mode YAML and new lovelace resource
     for mode GUI. It's better to add extra JS for all modes, because it has
     random url to avoid problems with the cache. But chromecast don't support
-    extra JS urls and can't load custom card.
+    extra JS urls and can't load custom card. Old resource is found by prefix
+    and replaced with url.
     """
     lovelace = hass.data["lovelace"]
     resources: ResourceStorageCollection = (
@@ -135,68 +347,225 @@ async def init_resource(hass: HomeAssistant, url: str, ver: str) -> bool:
     # force load storage
     await resources.async_get_info()
 
-    url2 = f"{url}?v={ver}"
-
     for item in resources.async_items():
-        if not item.get("url", "").startswith(url):
+        if not item.get("url", "").startswith(prefix):
             continue
 
         # no need to update
-        if item["url"].endswith(ver):
+        if item["url"] == url:
             return False
 
-        _LOGGER.debug(f"Update lovelace resource to: {url2}")
+        _LOGGER.debug(f"Update lovelace resource to: {url}")
 
         if isinstance(resources, ResourceStorageCollection):
             await resources.async_update_item(
-                item["id"], {"res_type": "module", "url": url2}
+                item["id"], {"res_type": "module", "url": url}
             )
         else:
             # not the best solution, but what else can we do
-            item["url"] = url2
+            item["url"] = url
 
         return True
 
     if isinstance(resources, ResourceStorageCollection):
-        _LOGGER.debug(f"Add new lovelace resource: {url2}")
-        await resources.async_create_item({"res_type": "module", "url": url2})
+        _LOGGER.debug(f"Add new lovelace resource: {url}")
+        await resources.async_create_item({"res_type": "module", "url": url})
     else:
-        _LOGGER.debug(f"Add extra JS module: {url2}")
-        add_extra_js_url(hass, url2)
+        _LOGGER.debug(f"Add extra JS module: {url}")
+        add_extra_js_url(hass, url)
 
     return True
 
 
 # noinspection PyProtectedMember
-def dash_cast(hass: HomeAssistant, entities: list, url: str, force: bool):
-    """Cast webpage to chromecast device via DashCast application."""
-    try:
-        for entity in hass.data[DATA_INSTANCES]["media_player"].entities:
-            if entity.entity_id not in entities or not hasattr(entity, "_chromecast"):
-                continue
+def get_chromecast(hass: HomeAssistant, entity_id: str):
+    if component := hass.data[DATA_INSTANCES].get("media_player"):
+        entity = component.get_entity(entity_id)
+        if hasattr(entity, "_chromecast"):
+            return entity
+    return None
 
-            if not hasattr(entity, "dashcast"):
-                from pychromecast.controllers.dashcast import DashCastController
 
-                entity.dashcast = DashCastController()
-                entity._chromecast.register_handler(entity.dashcast)
+def dash_cast_load(entity, url: str, force: bool, callback: Callable):
+    # reuse DashCast controller from previous casts to this device
+    if not hasattr(entity, "dashcast"):
+        from pychromecast.controllers.dashcast import DashCastController
 
-            _LOGGER.debug(f"DashCast to {entity.entity_id}")
-            entity.dashcast.load_url(url, force=force)
+        entity.dashcast = DashCastController()
+        entity._chromecast.register_handler(entity.dashcast)
+
+    entity.dashcast.load_url(url, force=force, callback_function=callback)
+
+
+async def dash_cast(
+    hass: HomeAssistant, entities: list, url: str, force: bool, timeout: int
+) -> dict:
+    """Cast webpage to chromecast devices via DashCast application. All devices
+    are casted in parallel. Return result and duration for each device.
+    """
+
+    async def cast(entity_id: str) -> dict:
+        ts = time.monotonic()
+        result = {"success": False}
+
+        if (entity := get_chromecast(hass, entity_id)) is None:
+            result["error"] = "Not a Chromecast device"
+            return result
+
+        future = hass.loop.create_future()
+
+        def callback(*args):
+            # called from pychromecast thread, args: msg_sent, response
+            success = args[0] if args else True
+            hass.loop.call_soon_threadsafe(
+                lambda: future.done() or future.set_result(success)
+            )
+
+        try:
+            _LOGGER.debug(f"DashCast to {entity_id}")
+            await hass.async_add_executor_job(
+                dash_cast_load, entity, url, force, callback
+            )
+            if await asyncio.wait_for(future, timeout):
+                result["success"] = True
+            else:
+                result["error"] = "Message not sent"
+        except asyncio.TimeoutError:
+            result["error"] = "Timeout"
+        except Exception as e:
+            result["error"] = repr(e)
+
+        result["time"] = round(time.monotonic() - ts, 3)
+        if not result["success"]:
+            _LOGGER.warning(f"Can't DashCast to {entity_id}: {result['error']}")
+        return result
+
+    results = await asyncio.gather(*[cast(entity_id) for entity_id in entities])
+    return dict(zip(entities, results))
 
-    except Exception as e:
-        _LOGGER.error(f"Can't DashCast to {entities}", exc_info=e)
+
+# signature => signed path, for same card poster and stream requests
+SIGNATURES = Cache(1024, lambda _: 1)
+# reason => count of rejected requests
+SIGN_REJECTS: dict[str, int] = {}
+
+
+def reject_signed_request(reason: str) -> bool:
+    _LOGGER.debug(f"Reject signed request: {reason}")
+    SIGN_REJECTS[reason] = SIGN_REJECTS.get(reason, 0) + 1
+    return False
 
 
 def validate_signed_request(request: web.Request) -> bool:
+    signature = request.query.get(SIGN_QUERY_PARAM)
+    if not signature:
+        return reject_signed_request("missing")
+
+    if (path := SIGNATURES.get(signature)) is None:
+        try:
+            hass = request.app["hass"]
+            secret = hass.data.get(DATA_SIGN_SECRET)
+            claims = jwt.decode(signature, secret, algorithms=["HS256"])
+            path = claims["path"]
+        except jwt.ExpiredSignatureError:
+            return reject_signed_request("expired")
+        except jwt.InvalidSignatureError:
+            return reject_signed_request("signature")
+        except Exception:
+            return reject_signed_request("invalid")
+
+        # cache valid signature until it expires
+        if (ttl := claims.get("exp", 0) - time.time()) > 0:
+            SIGNATURES.set(signature, path, ttl)
+
+    if path != request.path:
+        return reject_signed_request("path")
+
+    return True
+
+
+def resize_image(body: bytes, width: int, height: int, quality: int) -> bytes:
+    """Downscale image to fit width and height, and re-encode it to JPEG with
+    quality. Return the same body if Pillow isn't installed or nothing changed.
+    """
     try:
-        hass = request.app["hass"]
-        secret = hass.data.get(DATA_SIGN_SECRET)
-        signature = request.query.get(SIGN_QUERY_PARAM)
-        claims = jwt.decode(signature, secret, algorithms=["HS256"])
-        return claims["path"] == request.path
-    except Exception:
-        return False
+        from PIL import Image
+    except ImportError:
+        return body
+
+    try:
+        image = Image.open(io.BytesIO(body))
+        if (width and image.width > width) or (height and image.height > height):
+            # JPEG is decoded at reduced scale, so it's fast for 4K images
+            image.thumbnail((width or image.width, height or image.height))
+        elif not quality:
+            return body
+
+        buf = io.BytesIO()
+        image.convert("RGB").save(buf, "JPEG", quality=quality or 75)
+        return buf.getvalue() if buf.tell() < len(body) else body
+    except Exception as e:
+        _LOGGER.debug(f"Can't resize image: {repr(e)}")
+        return body
+
+
+def bundle_module(code: str) -> str:
+    """Wrap module to function scope, so its private names don't conflict."""
+    names = ", ".join(m[1] for m in RE_EXPORT.findall(code))
+    code = RE_EXPORT.sub(r"\1 \2", code)
+    return f"const {{{names}}} = (() => {{\n{code}\nreturn {{{names}}};\n}})();\n"
+
+
+def build_bundle(src: str, cache: str) -> tuple[str, dict[str, bytes]]:
+    """Join card modules to one file. Return content hash and file bodies
+    by encoding. Compressed files are cached on disk with hash in the name,
+    so they are rebuilt only when sources change. Brotli is optional.
+    """
+    parts = []
+    for name in BUNDLE_MODULES:
+        with open(os.path.join(src, name), encoding="utf-8") as f:
+            code = f.read()
+        if name == BUNDLE_MODULES[-1]:
+            parts.append(RE_IMPORT.sub("", code))
+        else:
+            parts.append(bundle_module(code))
+
+    body = "\n".join(parts).encode()
+    ver = hashlib.sha256(body).hexdigest()[:16]
+    bodies = {"identity": body}
+
+    compressors = {"gzip": lambda b: gzip.compress(b, 9, mtime=0)}
+    try:
+        import brotli
+
+        compressors["br"] = lambda b: brotli.compress(b, quality=11)
+    except ImportError:
+        pass
+
+    os.makedirs(cache, exist_ok=True)
+    for encoding, compress in compressors.items():
+        path = os.path.join(cache, f"webrtc-camera.{ver}.js.{encoding}")
+        try:
+            with open(path, "rb") as f:
+                bodies[encoding] = f.read()
+            continue
+        except FileNotFoundError:
+            pass
+
+        bodies[encoding] = compress(body)
+        try:
+            with open(path + ".tmp", "wb") as f:
+                f.write(bodies[encoding])
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            _LOGGER.warning(f"Can't save card bundle: {repr(e)}")
+
+    # remove bundles for old sources
+    for name in os.listdir(cache):
+        if name.startswith("webrtc-camera.") and f".{ver}." not in name:
+            os.remove(os.path.join(cache, name))
+
+    return ver, bodies
 
 
 async def check_go2rtc(hass: HomeAssistant, url: str = DEFAULT_URL) -> Optional[str]:
@@ -208,53 +577,415 @@ async def check_go2rtc(hass: HomeAssistant, url: str = DEFAULT_URL) -> Optional[
         return None
 
 
-def api_streams(hass: HomeAssistant) -> str:
-    entry = hass.data[DOMAIN]
-    go_url = "http://localhost:1984/" if isinstance(entry, Server) else entry
-    return urljoin(go_url, "api/streams")
+# url => go2rtc info or False, so form reopening doesn't probe servers again
+DISCOVERED = Cache(100, lambda _: 1)
+
 
+def discovery_url(host: str) -> str:
+    """Complete host or host:port to go2rtc URL."""
+    if "://" not in host:
+        host = "http://" + host
+    if host.count(":") == 1:
+        host += ":1984"
+    return host.rstrip("/") + "/"
 
-# copied from homeassistant.components.hassio.ingress import _websocket_forward
-async def websocket_forward(ws_from, ws_to) -> None:
+
+async def probe_go2rtc(hass: HomeAssistant, url: str) -> dict | None:
+    if (info := DISCOVERED.get(url)) is not None:
+        return info or None
+
+    ts = time.monotonic()
     try:
-        async for msg in ws_from:
-            if msg.type is aiohttp.WSMsgType.TEXT:
-                await ws_to.send_str(msg.data)
-            elif msg.type is aiohttp.WSMsgType.BINARY:
-                await ws_to.send_bytes(msg.data)
-            elif msg.type is aiohttp.WSMsgType.PING:
-                await ws_to.ping()
-            elif msg.type is aiohttp.WSMsgType.PONG:
-                await ws_to.pong()
-            elif ws_to.closed:
-                await ws_to.close(code=ws_to.close_code, message=msg.extra)  # type: ignore[arg-type]
-    except Exception as e:
-        _LOGGER.debug(f"WebSocket forward exception: {repr(e)}")
+        session = async_get_clientsession(hass)
+        async with session.get(urljoin(url, "api"), timeout=DISCOVERY_TIMEOUT) as r:
+            # version is unknown for server with auth
+            if r.status == 401:
+                info = {"url": url, "version": None}
+            elif r.ok and "version" in (data := await r.json(content_type=None)):
+                info = {"url": url, "version": data["version"]}
+    except Exception:
+        pass
+
+    if info:
+        info["latency"] = round((time.monotonic() - ts) * 1000)
+        DISCOVERED.set(url, info, 60)
+    else:
+        DISCOVERED.set(url, False, 10)
+    return info
+
+
+async def discover_go2rtc(hass: HomeAssistant, urls: list) -> list[dict]:
+    """Probe all URLs in parallel. Return found servers, the fastest first."""
+    tasks = [asyncio.create_task(probe_go2rtc(hass, url)) for url in dict.fromkeys(urls)]
+    pending = set(tasks)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        if any(task.result() for task in done):
+            if pending:
+                _, pending = await asyncio.wait(pending, timeout=DISCOVERY_GRACE)
+            break
+
+    for task in pending:
+        task.cancel()
+
+    found = [task.result() for task in tasks if task.done() and not task.cancelled()]
+    return sorted((info for info in found if info), key=lambda info: info["latency"])
+
+
+def api_streams(hass: HomeAssistant) -> str:
+    return urljoin(SERVERS.get(), "api/streams")
+
+
+def hide_credentials(src: str | None) -> str | None:
+    """Remove username and password from stream URL."""
+    return RE_CREDENTIALS.sub("//", src) if src else src
+
+
+class WebSocketForward:
+    """Forward messages from one WebSocket to another via send queue with limited
+    size. When the queue is full - drop binary frames until the next keyframe or
+    disconnect slow client, depending on policy.
+    """
+
+    def __init__(self, ws_from, ws_to, max_size: int = 0, policy: str = "drop"):
+        self.ws_from = ws_from
+        self.ws_to = ws_to
+        self.max_size = max_size  # bytes, 0 - unlimited
+        self.policy = policy
+
+        self.queue = asyncio.Queue()
+        self.queued_bytes = 0
+        self.wait_keyframe = False
+        self.video_tracks: set[int] = set()
+        self.disconnected = False
+
+        self.messages = 0
+        self.bytes = 0
+        self.first_frame: float | None = None  # time of first binary message
+        self.dropped_messages = 0
+        self.dropped_bytes = 0
+
+    async def run(self):
+        writer = asyncio.create_task(self.write())
+        try:
+            # queue may be filled by someone else, without ws_from
+            if self.ws_from is not None:
+                await self.read()
+                # send the rest of the queue, like errors before close
+                self.close()
+            await writer
+        except Exception as e:
+            _LOGGER.debug(f"WebSocket forward exception: {repr(e)}")
+        finally:
+            writer.cancel()
+
+    # copied from homeassistant.components.hassio.ingress import _websocket_forward
+    async def read(self):
+        async for msg in self.ws_from:
+            if msg.type is aiohttp.WSMsgType.BINARY:
+                if not await self.put_binary(msg.data):
+                    return
+            elif msg.type is aiohttp.WSMsgType.TEXT:
+                self.put_text(msg.data)
+            elif msg.type in (aiohttp.WSMsgType.PING, aiohttp.WSMsgType.PONG):
+                self.queue.put_nowait((msg.type, None))
+            elif self.ws_to.closed:
+                await self.ws_to.close(code=self.ws_to.close_code, message=msg.extra)  # type: ignore[arg-type]
+
+    async def put_binary(self, data: bytes) -> bool:
+        if self.disconnected:
+            return False
 
+        size = len(data)
+        overflow = self.max_size and self.queued_bytes + size > self.max_size
 
-class Server(Thread):
-    def __init__(self, binary: str):
-        super().__init__(name=DOMAIN, daemon=True)
+        if mp4.is_init(data):
+            # init segment should be always delivered
+            self.video_tracks = mp4.video_tracks(data)
+        elif overflow and self.policy == "disconnect":
+            _LOGGER.debug("WebSocket forward queue overflow, disconnect")
+            self.disconnect()
+            return False
+        elif overflow or (self.wait_keyframe and not self.is_keyframe(data)):
+            self.wait_keyframe = True
+            self.dropped_messages += 1
+            self.dropped_bytes += size
+            return True
+        else:
+            self.wait_keyframe = False
+
+        # bytes object is passed to send_bytes as is, without copying
+        self.queued_bytes += size
+        self.queue.put_nowait((aiohttp.WSMsgType.BINARY, data))
+        return True
+
+    def put_text(self, data: str):
+        self.queue.put_nowait((aiohttp.WSMsgType.TEXT, data))
+
+    def close(self):
+        """Stop writer after sending the rest of the queue."""
+        self.queue.put_nowait(None)
+
+    def disconnect(self):
+        """Drop the queue and let the writer close slow client. Doesn't wait for
+        the socket, so shared upstream isn't blocked by one viewer.
+        """
+        self.disconnected = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queued_bytes = 0
+        self.queue.put_nowait((aiohttp.WSMsgType.CLOSE, None))
+
+    def is_keyframe(self, data: bytes) -> bool:
+        # other binary frames are JPEG images for MJPEG mode
+        if mp4.is_fragment(data):
+            return mp4.is_keyframe(data, self.video_tracks)
+        return True
+
+    async def write(self):
+        while (item := await self.queue.get()) is not None:
+            msg_type, data = item
+            if msg_type is aiohttp.WSMsgType.BINARY:
+                self.queued_bytes -= len(data)
+                await self.ws_to.send_bytes(data)
+                self.bytes += len(data)
+                if self.first_frame is None:
+                    self.first_frame = time.monotonic()
+            elif msg_type is aiohttp.WSMsgType.TEXT:
+                await self.ws_to.send_str(data)
+                self.bytes += len(data)
+            elif msg_type is aiohttp.WSMsgType.PING:
+                await self.ws_to.ping()
+            elif msg_type is aiohttp.WSMsgType.PONG:
+                await self.ws_to.pong()
+            elif msg_type is aiohttp.WSMsgType.CLOSE:
+                await self.ws_to.close(code=aiohttp.WSCloseCode.TRY_AGAIN_LATER)
+                return
+            self.messages += 1
+
+
+class Server:
+    """Run go2rtc binary and restart it with exponential backoff if it exits."""
+
+    def __init__(self, hass: HomeAssistant, binary: str):
+        self.hass = hass
         self.binary = binary
-        self.process = None
+        self.process: asyncio.subprocess.Process | None = None
+        self.task: asyncio.Task | None = None
+        self.ready = False
+
+        self.restarts = 0
+        self.exit_code: int | None = None
+        self.started: float | None = None
+        self.log_tokens = LOG_BURST
+        self.log_suppressed = 0
 
     @property
-    def available(self):
-        return self.process.poll() is None if self.process else False
+    def available(self) -> bool:
+        return self.ready and self.process is not None and self.process.returncode is None
 
-    def run(self):
+    def start(self):
+        self.task = self.hass.loop.create_task(self.run())
+
+    async def run(self):
+        delay = RESTART_DELAY
         while self.binary:
-            self.process = subprocess.Popen(
-                [self.binary], stdout=subprocess.PIPE, stderr=subprocess.STDOUT
-            )
+            self.started = time.monotonic()
+            probe = None
+            try:
+                self.process = await asyncio.create_subprocess_exec(
+                    self.binary,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT,
+                )
+                probe = asyncio.create_task(self.probe())
+                await self.pump_logs()
+                self.exit_code = await self.process.wait()
+            except Exception as e:
+                _LOGGER.error("Can't run go2rtc", exc_info=e)
+            finally:
+                self.ready = False
+                if probe:
+                    probe.cancel()
+
+            if not self.binary:
+                return
+
+            # reset backoff if go2rtc worked long enough
+            if time.monotonic() - self.started > RESTART_DELAY_RESET:
+                delay = RESTART_DELAY
+
+            self.restarts += 1
+            _LOGGER.warning(f"go2rtc exited with code {self.exit_code}, restart in {delay}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RESTART_DELAY_MAX)
+
+    async def probe(self):
+        """Set ready after go2rtc API starts to respond."""
+        session = async_get_clientsession(self.hass)
+        ts = time.monotonic()
+        while True:
+            try:
+                # any response is OK, API may be protected with password
+                async with session.head(DEFAULT_URL, timeout=2, allow_redirects=False):
+                    self.ready = True
+                    return
+            except Exception:
+                pass
+
+            if ts and time.monotonic() - ts > 30:
+                _LOGGER.warning(f"go2rtc API doesn't respond on {DEFAULT_URL}")
+                ts = None
+
+            await asyncio.sleep(0.5)
+
+    async def pump_logs(self):
+        ts = time.monotonic()
+        while line := await self.process.stdout.readline():
+            # rate limit for logs with tokens bucket
+            now = time.monotonic()
+            self.log_tokens = min(self.log_tokens + (now - ts) * LOG_RATE, LOG_BURST)
+            ts = now
+
+            # example: 12:34:56.789 INF [api] listen addr=:1984
+            line = line.rstrip().decode(errors="replace")
+            level = LOG_LEVELS.get(line[13:16], logging.DEBUG)
+
+            # errors are never suppressed
+            if self.log_tokens < 1 and level < logging.ERROR:
+                self.log_suppressed += 1
+                continue
+
+            self.log_tokens -= 1
+
+            if self.log_suppressed:
+                _GO2RTC_LOGGER.warning(f"{self.log_suppressed} log lines suppressed")
+                self.log_suppressed = 0
 
-            # check alive
-            while self.process.poll() is None:
-                line = self.process.stdout.readline()
-                if line == b"":
-                    break
-                _LOGGER.debug(line[:-1].decode())
+            _GO2RTC_LOGGER.log(level, line)
 
-    def stop(self, *args):
+    async def stop(self, *args):
         self.binary = None
-        self.process.terminate()
+
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                _LOGGER.warning("go2rtc doesn't stop, kill it")
+                self.process.kill()
+                await self.process.wait()
+
+        if self.task:
+            self.task.cancel()
+
+    def diagnostics(self) -> dict:
+        return {
+            "binary": os.path.basename(self.binary or ""),
+            "pid": self.process.pid if self.process else None,
+            "available": self.available,
+            "uptime": round(time.monotonic() - self.started) if self.started else None,
+            "restarts": self.restarts,
+            "exit_code": self.exit_code,
+            "log_suppressed": self.log_suppressed,
+        }
+
+
+class Servers:
+    """Registry of go2rtc servers with periodic health checks. Unavailable
+    servers are skipped by routing until the next successful check.
+    """
+
+    def __init__(self):
+        # url => {"available", "sessions"}
+        self.servers: dict[str, dict] = {}
+        self.server: Server | None = None
+        self.routing = "least_loaded"
+        self.task: asyncio.Task | None = None
+
+    def setup(self, hass: HomeAssistant, entry: str | Server, urls: list, routing: str):
+        if isinstance(entry, Server):
+            self.server = entry
+            entry = DEFAULT_URL
+
+        # main server is already checked, others will be checked in a moment
+        self.servers = {entry: {"available": True, "sessions": 0}}
+        for url in urls:
+            self.servers.setdefault(url, {"available": False, "sessions": 0})
+        self.routing = routing
+
+        # main server is never marked unavailable, so it has nothing to recheck
+        if len(self.servers) > 1:
+            self.task = hass.loop.create_task(self.run(hass))
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self, hass: HomeAssistant):
+        while True:
+            urls = [url for url in self.servers if url != self.main]
+            tests = await asyncio.gather(*[check_go2rtc(hass, url) for url in urls])
+            for url, test in zip(urls, tests):
+                self.set_available(url, test is not None)
+            await asyncio.sleep(HEALTH_INTERVAL)
+
+    @property
+    def embedded(self) -> str | None:
+        return DEFAULT_URL if self.server else None
+
+    @property
+    def main(self) -> str | None:
+        return next(iter(self.servers), None)
+
+    def is_available(self, url: str) -> bool:
+        if url == self.embedded:
+            return self.server.available
+        return self.servers[url]["available"]
+
+    def set_available(self, url: str, available: bool):
+        # one network blip shouldn't leave integration without servers
+        if (server := self.servers.get(url)) is None or url == self.main:
+            return
+        if server["available"] != available:
+            state = "available" if available else "unavailable"
+            _LOGGER.info(f"go2rtc server {hide_credentials(url)} is {state}")
+        server["available"] = available
+
+    def urls(self) -> list[str]:
+        return [url for url in self.servers if self.is_available(url)]
+
+    def get(self, src: str = None) -> str:
+        """Return URL of the go2rtc server for this stream. Without stream the
+        first available server is returned, the main one is preferred.
+        """
+        assert self.servers, "WebRTC server not available"
+        # embedded server may be down, but there is nothing better
+        urls = self.urls() or [self.main]
+
+        if src is None or len(urls) == 1:
+            return urls[0]
+
+        if self.routing == "hash":
+            # rendezvous hashing, so only streams of the failed server are moved
+            return max(urls, key=lambda url: hashlib.md5((url + src).encode()).digest())
+
+        return min(urls, key=lambda url: self.servers[url]["sessions"])
+
+    def acquire(self, url: str):
+        if server := self.servers.get(url):
+            server["sessions"] += 1
+
+    def release(self, url: str):
+        if server := self.servers.get(url):
+            server["sessions"] -= 1
+
+    def as_dict(self) -> dict:
+        return {
+            hide_credentials(url): {**server, "available": self.is_available(url)}
+            for url, server in self.servers.items()
+        }
+
+
+SERVERS = Servers()
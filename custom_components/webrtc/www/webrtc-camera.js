@@ -33,6 +33,9 @@ class WebRTCCamera extends VideoRTC {
          *     title: string,
          *     poster: string,
          *     poster_remote: boolean,
+         *     poster_width: number|string,
+         *     poster_quality: number,
+         *     poster_batch: boolean,
          *     muted: boolean,
          *     intersection: number,
          *     ui: boolean,
@@ -40,6 +43,9 @@ class WebRTCCamera extends VideoRTC {
          *     background: boolean,
          *
          *     server: string,
+         *     fanout: boolean,
+         *     mjpeg_img: boolean,
+         *     mjpeg_fps: number,
          *
          *     mse: boolean,
          *     webrtc: boolean,
@@ -100,6 +106,21 @@ class WebRTCCamera extends VideoRTC {
         return {'url': ''};
     }
 
+    posterParams() {
+        const params = {poster: this.config.poster};
+        if (this.config.poster_width === 'auto') {
+            // round up to 100px, so cards with similar width share one cached poster
+            const width = Math.ceil(this.clientWidth * window.devicePixelRatio / 100) * 100;
+            if (width) params.width = width;
+        } else if (this.config.poster_width) {
+            params.width = this.config.poster_width;
+        }
+        if (this.config.poster_quality) {
+            params.quality = this.config.poster_quality;
+        }
+        return params;
+    }
+
     setStatus(mode, status) {
         const divMode = this.querySelector('.mode').innerText;
         if (mode === 'error' && divMode !== 'Loading..' && divMode !== 'Loading...') return;
@@ -142,17 +163,26 @@ class WebRTCCamera extends VideoRTC {
     onconnect() {
         if (!this.config || !this.hass) return false;
         if (!this.isConnected || this.ws || this.pc) return false;
+        if (this.img && this.img.hasAttribute('src')) return false;
 
         const divMode = this.querySelector('.mode').innerText;
         if (divMode === 'Loading..') return;
 
         this.setStatus('Loading..');
 
+        const poster = this.config.poster && !this.config.poster_remote ? this.posterParams() : null;
+        if (poster && this.config.poster_batch) {
+            PosterBatch.load(this.hass, poster).then(url => {
+                this.video.poster = url;
+            }).catch(() => {
+            });
+        }
+
         this.hass.callWS({
             type: 'auth/sign_path', path: '/api/webrtc/ws'
         }).then(data => {
-            if (this.config.poster && !this.config.poster_remote) {
-                this.video.poster = this.hass.hassUrl(data.path) + '&poster=' + encodeURIComponent(this.config.poster);
+            if (poster && !this.config.poster_batch) {
+                this.video.poster = this.hass.hassUrl(data.path) + '&' + new URLSearchParams(poster);
             }
 
             this.wsURL = 'ws' + this.hass.hassUrl(data.path).substring(4);
@@ -170,6 +200,18 @@ class WebRTCCamera extends VideoRTC {
                 this.wsURL += '&server=' + encodeURIComponent(this.config.server);
             }
 
+            if (this.config.fanout) {
+                this.wsURL += '&fanout=1';
+            }
+
+            // server can use shared upstream with keyframe cache for MSE only cards
+            this.wsURL += '&mode=' + encodeURIComponent(this.mode);
+
+            if (this.config.mjpeg_img) {
+                this.onmjpegimg('http' + this.wsURL.substring(2));
+                return;
+            }
+
             if (super.onconnect()) {
                 this.setStatus('Loading...');
             } else {
@@ -180,6 +222,33 @@ class WebRTCCamera extends VideoRTC {
         });
     }
 
+    /**
+     * Server side MJPEG, browser shows it without decoding frames in JS.
+     * @param {string} url
+     */
+    onmjpegimg(url) {
+        if (!this.img) {
+            this.img = document.createElement('img');
+            this.img.style.cssText = 'display: block; width: 100%; height: 100%; object-fit: contain;';
+            this.img.addEventListener('error', () => {
+                this.setStatus('error', 'unable to load MJPEG');
+                this.img.removeAttribute('src');
+                setTimeout(() => this.onconnect(), this.RECONNECT_TIMEOUT);
+            });
+            this.video.style.display = 'none';
+            this.querySelector('.ptz-transform').appendChild(this.img);
+        }
+
+        this.img.src = url + '&mjpeg=1' + (this.config.mjpeg_fps ? '&fps=' + this.config.mjpeg_fps : '');
+        this.setStatus('MJPEG', this.config.title || '');
+    }
+
+    ondisconnect() {
+        super.ondisconnect();
+        // close server side MJPEG connection
+        if (this.img) this.img.removeAttribute('src');
+    }
+
     onopen() {
         const result = super.onopen();
 
@@ -680,6 +749,31 @@ class WebRTCCamera extends VideoRTC {
 
 customElements.define('webrtc-camera', WebRTCCamera);
 
+/** Load posters of all cards on the dashboard with one request. */
+const PosterBatch = {
+    queue: [],
+    timer: 0,
+    load(hass, params) {
+        return new Promise((resolve, reject) => {
+            this.queue.push({params, resolve, reject});
+            if (!this.timer) this.timer = setTimeout(() => this.flush(hass), 20);
+        });
+    },
+    flush(hass) {
+        this.timer = 0;
+        // server limit for posters in one request
+        while (this.queue.length) this.send(hass, this.queue.splice(0, 64));
+    },
+    send(hass, queue) {
+        hass.callApi('POST', 'webrtc/posters', {posters: queue.map(item => item.params)}).then(data => {
+            data.posters.forEach((poster, i) => {
+                if (poster.data) queue[i].resolve(`data:${poster.content_type};base64,${poster.data}`);
+                else queue[i].reject(poster.error);
+            });
+        }).catch(e => queue.forEach(item => item.reject(e)));
+    },
+};
+
 const card = {
     type: 'webrtc-camera',
     name: 'WebRTC Camera',
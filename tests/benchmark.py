@@ -0,0 +1,368 @@
+"""Load and latency benchmark for the WebSocket and HLS proxy.
+
+Fake go2rtc and clients run in separate processes, so CPU and RSS of the main
+process is the Hass side of the proxy. Frames carry the monotonic time when
+they were sent by fake go2rtc, so latency is measured through the proxy.
+
+    python tests/benchmark.py --mode mse --clients 50 --output v3.6.1.json
+    python tests/benchmark.py --mode mse --clients 50 --baseline v3.6.1.json
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import platform
+import resource
+import socket
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+import aiohttp
+import jwt
+from aiohttp import web
+
+SECRET = "benchmark"
+TIMESTAMP = struct.Struct(">d")
+
+# metrics for --baseline comparison, more is better for throughput only
+COMPARE = (
+    ("throughput", "bytes_per_s"),
+    ("latency_ms", "p50"),
+    ("latency_ms", "p99"),
+    ("cpu", "per_stream_percent"),
+    ("peak_rss_mb",),
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def box(name: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + name + payload
+
+
+def full_box(name: bytes, flags: int, payload: bytes) -> bytes:
+    return box(name, flags.to_bytes(4, "big") + payload)
+
+
+def mp4_init() -> bytes:
+    tkhd = full_box(b"tkhd", 3, b"\0" * 8 + struct.pack(">I", 1) + b"\0" * 60)
+    hdlr = full_box(b"hdlr", 0, b"\0" * 4 + b"vide" + b"\0" * 12)
+    trak = box(b"trak", tkhd + box(b"mdia", hdlr))
+    return box(b"ftyp", b"iso5\0\0\0\0") + box(b"moov", trak)
+
+
+def mp4_fragment(keyframe: bool, size: int) -> bytearray:
+    flags = 0x02000000 if keyframe else 0x01010000
+    tfhd = full_box(b"tfhd", 0x20, struct.pack(">II", 1, 0x01010000))
+    trun = full_box(b"trun", 0x205, struct.pack(">IiII", 1, 0, flags, size))
+    moof = box(b"moof", box(b"traf", tfhd + trun))
+    return bytearray(moof + box(b"mdat", b"\0" * size))
+
+
+def stamp(frame: bytearray) -> bytes:
+    frame[-TIMESTAMP.size :] = TIMESTAMP.pack(time.monotonic())
+    return bytes(frame)
+
+
+def latency(data: bytes) -> float:
+    return time.monotonic() - TIMESTAMP.unpack(data[-TIMESTAMP.size :])[0]
+
+
+# fake go2rtc
+
+
+def go2rtc_app(args) -> web.Application:
+    interval = 1 / args.fps
+    keyframe = [True] + [False] * (args.gop - 1)
+    fragments = [mp4_fragment(k, args.size) for k in keyframe]
+    jpeg = bytearray(b"\xff\xd8" + b"\0" * args.size)
+
+    async def ws_handler(request: web.Request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        msg = await ws.receive()
+        mode = json.loads(msg.data)["type"]
+
+        async def send():
+            if mode == "mse":
+                await ws.send_str('{"type":"mse","value":"video/mp4; codecs=\\"avc1.640029\\""}')
+                await ws.send_bytes(mp4_init())
+            i = 0
+            while not ws.closed:
+                if mode == "mse":
+                    await ws.send_bytes(stamp(fragments[i % args.gop]))
+                else:
+                    await ws.send_bytes(stamp(jpeg))
+                i += 1
+                await asyncio.sleep(interval)
+
+        task = asyncio.create_task(send())
+        async for _ in ws:
+            pass
+        task.cancel()
+        return ws
+
+    async def playlist(request: web.Request):
+        n = int(time.time() / args.target_duration)
+        segments = "".join(
+            f"#EXTINF:{args.target_duration}.000,\nsegment.m4s?id={request.query['id']}&n={i}\n"
+            for i in range(n - 2, n + 1)
+        )
+        body = (
+            f"#EXTM3U\n#EXT-X-VERSION:6\n#EXT-X-TARGETDURATION:{args.target_duration}\n"
+            f"#EXT-X-MEDIA-SEQUENCE:{n - 2}\n" + segments
+        )
+        return web.Response(text=body, content_type="application/vnd.apple.mpegurl")
+
+    async def segment(request: web.Request):
+        # one second of video per segment
+        size = args.size * args.fps * args.target_duration
+        return web.Response(body=b"\0" * size, content_type="video/iso.segment")
+
+    async def index(request: web.Request):
+        # health check of go2rtc servers
+        return web.Response(text="go2rtc")
+
+    app = web.Application()
+    app.router.add_get("/", index)
+    app.router.add_get("/api/ws", ws_handler)
+    app.router.add_get("/api/hls/playlist.m3u8", playlist)
+    app.router.add_get("/api/hls/segment.m4s", segment)
+    return app
+
+
+def run_go2rtc(args, port: int):
+    web.run_app(go2rtc_app(args), host="127.0.0.1", port=port, print=None)
+
+
+# clients
+
+
+async def ws_client(session: aiohttp.ClientSession, url: str, args, result: dict):
+    start = time.monotonic()
+    request = {"type": args.mode, "value": "avc1.640029"}
+    async with session.ws_connect(url) as ws:
+        await ws.send_str(json.dumps(request))
+        async for msg in ws:
+            if msg.type is aiohttp.WSMsgType.TEXT:
+                if json.loads(msg.data)["type"] == "error":
+                    result["errors"] += 1
+                continue
+            if msg.type is not aiohttp.WSMsgType.BINARY:
+                break
+            result["bytes"] += len(msg.data)
+            if msg.data[4:8] == b"ftyp":
+                continue
+            result["messages"] += 1
+            result["latency"].append(latency(msg.data))
+            if start:
+                result["first_frame"].append(time.monotonic() - start)
+                start = None
+
+
+async def hls_client(session: aiohttp.ClientSession, url: str, args, result: dict):
+    start = time.monotonic()
+    loaded = set()
+    while True:
+        async with session.get(url) as r:
+            playlist = await r.text()
+        for line in playlist.splitlines():
+            if line.startswith("segment") and line not in loaded:
+                loaded.add(line)
+                ts = time.monotonic()
+                async with session.get(url.replace("playlist.m3u8", line)) as r:
+                    body = await r.read()
+                result["bytes"] += len(body)
+                result["messages"] += 1
+                result["latency"].append(time.monotonic() - ts)
+                if start:
+                    result["first_frame"].append(time.monotonic() - start)
+                    start = None
+        await asyncio.sleep(args.target_duration / 2)
+
+
+async def clients(args, port: int, cookie: str) -> dict:
+    result = {"messages": 0, "bytes": 0, "errors": 0, "latency": [], "first_frame": []}
+    sig = jwt.encode({"path": "/api/webrtc/ws"}, SECRET, "HS256")
+    base = f"http://127.0.0.1:{port}/api/webrtc"
+
+    async def client(i: int):
+        async with aiohttp.ClientSession(cookies={"webrtc-hls-session": cookie}) as s:
+            if args.mode == "hls":
+                url = f"{base}/hls/playlist.m3u8?id=stream{i % args.streams}"
+                await hls_client(s, url, args, result)
+            else:
+                url = f"{base}/ws?authSig={sig}&url=stream{i % args.streams}"
+                if args.fanout:
+                    url += "&fanout=1"
+                await ws_client(s, url, args, result)
+
+    tasks = [asyncio.create_task(client(i)) for i in range(args.clients)]
+    done, _ = await asyncio.wait(tasks, timeout=args.duration)
+    for task in tasks:
+        task.cancel()
+    result["errors"] += sum(1 for task in done if task.exception())
+    return result
+
+
+def run_clients(args, port: int, cookie: str, conn):
+    conn.send(asyncio.run(clients(args, port, cookie)))
+
+
+# Hass side
+
+
+async def hass_proxy(args, go2rtc_port: int) -> dict:
+    from homeassistant.components.http.auth import DATA_SIGN_SECRET
+    from homeassistant.core import HomeAssistant
+
+    import custom_components.webrtc as webrtc
+    from custom_components.webrtc import utils
+
+    hass = HomeAssistant(tempfile.mkdtemp())
+    hass.data[DATA_SIGN_SECRET] = SECRET
+    hass.data[webrtc.DOMAIN] = f"http://127.0.0.1:{go2rtc_port}/"
+    utils.SERVERS.setup(hass, hass.data[webrtc.DOMAIN], [], "least_loaded")
+    webrtc.SETTINGS["fanout"] = args.fanout
+
+    app = web.Application()
+    app["hass"] = hass
+    app.router.add_get("/api/webrtc/ws", webrtc.WebSocketView().get)
+    hls = webrtc.HLSView()
+    app.router.add_get(
+        "/api/webrtc/hls/{filename}", lambda r: hls.get(r, r.match_info["filename"])
+    )
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+
+    conn, child_conn = multiprocessing.Pipe(False)
+    proc = multiprocessing.Process(
+        target=run_clients, args=(args, port, webrtc.HLS_SESSION, child_conn)
+    )
+
+    cpu = time.process_time()
+    ts = time.monotonic()
+    proc.start()
+    result = await asyncio.to_thread(conn.recv)
+    cpu = time.process_time() - cpu
+    duration = time.monotonic() - ts
+
+    proc.join()
+    await runner.cleanup()
+    utils.SERVERS.stop()
+
+    result["cpu"] = cpu
+    result["duration"] = duration
+    result["proxy"] = webrtc.STATS.totals()
+    return result
+
+
+def percentile(values: list, p: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(len(values) * p), len(values) - 1)] * 1000, 2)
+
+
+def report(args, result: dict) -> dict:
+    manifest = json.loads((ROOT / "custom_components/webrtc/manifest.json").read_text())
+    duration = result["duration"]
+    return {
+        "version": manifest["version"],
+        "python": platform.python_version(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "args": vars(args),
+        "clients": args.clients,
+        "errors": result["errors"],
+        "throughput": {
+            "messages_per_s": round(result["messages"] / duration, 1),
+            "bytes_per_s": round(result["bytes"] / duration),
+        },
+        "latency_ms": {
+            "p50": percentile(result["latency"], 0.5),
+            "p99": percentile(result["latency"], 0.99),
+            "max": percentile(result["latency"], 1),
+        },
+        "first_frame_ms": {
+            "p50": percentile(result["first_frame"], 0.5),
+            "p99": percentile(result["first_frame"], 0.99),
+        },
+        "cpu": {
+            "seconds": round(result["cpu"], 3),
+            "percent": round(result["cpu"] / duration * 100, 1),
+            "per_stream_percent": round(result["cpu"] / duration * 100 / args.clients, 3),
+        },
+        # Linux returns kilobytes, macOS returns bytes
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            / (1024 * 1024 if sys.platform == "darwin" else 1024),
+            1,
+        ),
+        "proxy": result["proxy"],
+    }
+
+
+def compare(data: dict, baseline: dict):
+    print(f"compare with {baseline['version']} ({baseline['time']}):", file=sys.stderr)
+    for path in COMPARE:
+        new, old = data, baseline
+        for key in path:
+            new, old = new[key], old[key]
+        change = f"{(new - old) / old * 100:+.1f}%" if new is not None and old else ""
+        print(f"  {'.'.join(path)}: {old} -> {new} {change}", file=sys.stderr)
+
+
+def run(args) -> dict:
+    go2rtc_port = free_port()
+    go2rtc = multiprocessing.Process(target=run_go2rtc, args=(args, go2rtc_port))
+    go2rtc.start()
+    try:
+        time.sleep(0.5)
+        return report(args, asyncio.run(hass_proxy(args, go2rtc_port)))
+    finally:
+        go2rtc.terminate()
+        go2rtc.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--mode", choices=("mse", "mjpeg", "hls"), default="mse")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--streams", type=int, default=1, help="different sources")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--gop", type=int, default=25, help="frames per keyframe")
+    parser.add_argument("--size", type=int, default=10000, help="bytes per frame")
+    parser.add_argument("--target-duration", type=int, default=1, help="HLS segment")
+    parser.add_argument("--fanout", action="store_true", help="share upstream")
+    parser.add_argument("--output", help="JSON file, default stdout")
+    parser.add_argument("--baseline", help="JSON file from previous run")
+    args = parser.parse_args()
+
+    data = run(args)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(data, indent=2))
+    else:
+        print(json.dumps(data, indent=2))
+
+    if args.baseline:
+        compare(data, json.loads(Path(args.baseline).read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import asyncio
+
+from custom_components.webrtc.admission import Admission
+
+
+def test_source_limit():
+    async def main():
+        admission = Admission()
+        admission.max_source = 2
+        admission.timeout = 0.2
+
+        assert await admission.acquire("cam1", "1.1.1.1") is None
+        assert await admission.acquire("cam1", "1.1.1.2") is None
+        assert await admission.acquire("cam2", "1.1.1.3") is None
+
+        # wait for a free slot in the queue
+        task = asyncio.create_task(admission.acquire("cam1", "1.1.1.4"))
+        await asyncio.sleep(0.05)
+        assert admission.waiting == 1
+        admission.release("cam1", "1.1.1.1")
+        assert await task is None
+
+        # no free slot until timeout
+        assert await admission.acquire("cam1", "1.1.1.5") == "source"
+
+        assert admission.as_dict() == {
+            "active": 3,
+            "waiting": 0,
+            "admitted": 4,
+            "queued": 2,
+            "rejected": {"source": 1},
+        }
+
+    asyncio.run(main())
+
+
+def test_client_and_total_limit():
+    async def main():
+        admission = Admission()
+        admission.max_client = 1
+        admission.max_total = 2
+
+        assert await admission.acquire("cam1", "1.1.1.1") is None
+        assert await admission.acquire("cam2", "1.1.1.1") == "client"
+        assert await admission.acquire("cam2", "1.1.1.2") is None
+        assert await admission.acquire("cam3", "1.1.1.3") == "total"
+
+        admission.release("cam1", "1.1.1.1")
+        assert await admission.acquire("cam2", "1.1.1.1") is None
+        assert admission.sources == {"cam2": 2}
+
+    asyncio.run(main())
+
+
+def test_rate_limit():
+    async def main():
+        admission = Admission()
+        admission.rate = 1
+        admission.burst = 3
+
+        results = [await admission.acquire("cam1", "1.1.1.1") for _ in range(4)]
+        assert results == [None, None, None, "rate"]
+
+        # other clients have own bucket
+        assert await admission.acquire("cam1", "1.1.1.2") is None
+
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+import asyncio
+import hashlib
+import io
+import os
+import zipfile
+
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+
+from custom_components.webrtc.utils import check_binary, download_binary
+
+BINARY = b"#!/bin/sh\necho go2rtc version 1.9.11\n"
+
+
+def zip_binary() -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("go2rtc.exe", BINARY)
+    return buf.getvalue()
+
+
+def download(tmp_path, asset: str, sha256: str = None) -> bool:
+    async def handler(request: web.Request):
+        if request.match_info["asset"] == "go2rtc_linux_amd64":
+            return web.Response(body=BINARY)
+        if request.match_info["asset"] == "go2rtc_win64.zip":
+            return web.Response(body=zip_binary())
+        raise web.HTTPNotFound()
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/{asset}", handler)
+        async with TestServer(app) as server, ClientSession() as session:
+            url = str(server.make_url("/" + asset))
+            return await download_binary(session, url, str(tmp_path / "go2rtc"), sha256)
+
+    return asyncio.run(main())
+
+
+def test_download(tmp_path):
+    sha256 = hashlib.sha256(BINARY).hexdigest()
+    assert download(tmp_path, "go2rtc_linux_amd64", sha256)
+    assert (tmp_path / "go2rtc").read_bytes() == BINARY
+    assert os.access(tmp_path / "go2rtc", os.X_OK)
+    assert os.listdir(tmp_path) == ["go2rtc"]
+
+
+def test_download_zip(tmp_path):
+    assert download(tmp_path, "go2rtc_win64.zip")
+    assert (tmp_path / "go2rtc").read_bytes() == BINARY
+    assert os.listdir(tmp_path) == ["go2rtc"]
+
+
+def test_download_errors(tmp_path):
+    assert not download(tmp_path, "go2rtc_linux_amd64", "wrong")
+    assert not download(tmp_path, "go2rtc_linux_arm")
+    assert os.listdir(tmp_path) == []
+
+
+def test_check_binary(tmp_path):
+    filename = str(tmp_path / "go2rtc")
+    stamp = str(tmp_path / ".go2rtc.json")
+    assert not check_binary(filename, stamp)
+
+    assert download(tmp_path, "go2rtc_linux_amd64")
+    assert check_binary(filename, stamp)
+    assert os.path.isfile(stamp)
+
+    # binary is not executed when its hash is the same as in the stamp
+    os.chmod(filename, 0o644)
+    assert check_binary(filename, stamp)
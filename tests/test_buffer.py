@@ -0,0 +1,33 @@
+from custom_components.webrtc.buffer import RingBuffer
+
+
+def fill(ring: RingBuffer, count: int):
+    for i in range(count):
+        size = 3000 + i * 37 % 2000
+        ring.append(i, bytes([i % 256]) * size, i % 10 == 0)
+
+
+def test_ring_buffer():
+    ring = RingBuffer(100_000, 1000)
+    fill(ring, 200)
+
+    # items don't overlap and are not overwritten
+    ranges = sorted((o, o + n) for _, o, n, _ in ring.items)
+    assert all(a[1] <= b[0] for a, b in zip(ranges, ranges[1:]))
+    assert all(ring.buf[o] == ts % 256 for ts, o, _, _ in ring.items)
+    assert [ts for ts, *_ in ring.items] == list(range(200 - len(ring.items), 200))
+
+    # snapshot starts from keyframe
+    start, chunks = ring.snapshot(195)
+    assert start == 190
+    assert len(chunks) == 10
+
+
+def test_ring_buffer_seconds():
+    ring = RingBuffer(1_000_000, 50)
+    fill(ring, 200)
+    assert ring.items[0][0] == 149
+
+    # buffer is shorter than requested, start from the first keyframe
+    start, _ = ring.snapshot(100)
+    assert start == 150
@@ -0,0 +1,32 @@
+import gzip
+import os
+import shutil
+from pathlib import Path
+
+from custom_components.webrtc.utils import BUNDLE_MODULES, build_bundle
+
+WWW = Path(__file__).parent.parent / "custom_components" / "webrtc" / "www"
+
+
+def test_bundle(tmp_path):
+    src = tmp_path / "www"
+    src.mkdir()
+    for name in BUNDLE_MODULES:
+        shutil.copy(WWW / name, src / name)
+
+    cache = str(tmp_path / "cache")
+    ver, bodies = build_bundle(str(src), cache)
+    assert gzip.decompress(bodies["gzip"]) == bodies["identity"]
+    assert b"\nimport " not in bodies["identity"]
+    assert b"\nexport " not in bodies["identity"]
+    assert f"webrtc-camera.{ver}.js.gzip" in os.listdir(cache)
+
+    # same sources - same hash and cached file
+    assert build_bundle(str(src), cache)[0] == ver
+
+    # changed sources - new hash and old files removed
+    with open(src / "webrtc-camera.js", "a") as f:
+        f.write("\n// changed\n")
+    ver2, _ = build_bundle(str(src), cache)
+    assert ver2 != ver
+    assert all(f".{ver2}." in name for name in os.listdir(cache))
@@ -0,0 +1,171 @@
+import asyncio
+import types
+
+from custom_components.webrtc import buffer, fanout, prewarm
+from custom_components.webrtc.utils import WebSocketForward
+from test_mp4 import mp4_fragment, mp4_init
+
+
+class SlowSocket:
+    """Viewer socket, that never finishes closing."""
+
+    def __init__(self):
+        self.close_code = None
+
+    async def send_bytes(self, data: bytes):
+        await asyncio.sleep(3600)
+
+    async def close(self, code: int = None):
+        self.close_code = code
+        await asyncio.sleep(3600)
+
+
+async def new_hub() -> fanout.Hub:
+    hass = types.SimpleNamespace(loop=asyncio.get_running_loop())
+    return fanout.Hub(hass, ("ws://localhost:1984/api/ws?src=cam", '{"type":"mjpeg"}'))
+
+
+def test_slow_viewer(monkeypatch):
+    monkeypatch.setattr(fanout.Hub, "run", lambda self: asyncio.sleep(3600))
+
+    async def main():
+        hub = await new_hub()
+        slow = WebSocketForward(None, SlowSocket(), 1000, "disconnect")
+        fast = WebSocketForward(None, None)
+        await hub.subscribe(slow)
+        await hub.subscribe(fast)
+
+        # upstream isn't blocked by closing of the slow viewer
+        await asyncio.wait_for(hub.on_binary(b"\xff\xd8" + b"\0" * 2000), 0.1)
+        assert hub.subscribers == {fast}
+        assert fast.queue.qsize() == 1
+
+        writer = asyncio.create_task(slow.write())
+        await asyncio.sleep(0)
+        assert slow.ws_to.close_code == 1013
+        writer.cancel()
+        hub.task.cancel()
+
+    asyncio.run(main())
+
+
+def test_unsubscribe_twice(monkeypatch):
+    monkeypatch.setattr(fanout.Hub, "run", lambda self: asyncio.sleep(3600))
+    monkeypatch.setattr(fanout, "LINGER", 0.05)
+
+    async def main():
+        hub = await new_hub()
+        forward = WebSocketForward(None, None)
+        await hub.subscribe(forward)
+
+        # by the hub for slow viewer and then by the session
+        hub.unsubscribe(forward)
+        hub.unsubscribe(forward)
+
+        await hub.subscribe(WebSocketForward(None, None))
+        await asyncio.sleep(0.1)
+        assert not hub.task.done()
+        hub.task.cancel()
+
+    asyncio.run(main())
+
+
+def test_gop_replay(monkeypatch):
+    monkeypatch.setattr(fanout.Hub, "run", lambda self: asyncio.sleep(3600))
+
+    async def main():
+        hub = await new_hub()
+        hub.init = mp4_init()
+        hub.gop = [mp4_fragment(1, True, 400), mp4_fragment(1, False, 400)]
+        hub.gop_size = sum(len(data) for data in hub.gop)
+        hub.streaming = True
+
+        # cached GOP is replayed and live stream continues it
+        forward = WebSocketForward(None, None, 2000)
+        await hub.subscribe(forward)
+        assert forward.queue.qsize() == 3
+        assert not forward.wait_keyframe
+
+        # GOP doesn't fit the queue, so viewer waits for live keyframe
+        forward = WebSocketForward(None, None, 1000)
+        await hub.subscribe(forward)
+        assert forward.queue.qsize() == 1
+        assert forward.dropped_messages == 0
+        assert forward.wait_keyframe
+
+        hub.task.cancel()
+
+    asyncio.run(main())
+
+
+def test_mse_only():
+    assert fanout.mse_only("mse")
+    assert fanout.mse_only("mse,mjpeg")
+    assert not fanout.mse_only("webrtc,mse,mjpeg")
+    assert not fanout.mse_only(None)
+
+
+def test_latest_frame(monkeypatch):
+    monkeypatch.setattr(fanout.Hub, "run", lambda self: asyncio.sleep(3600))
+
+    async def main():
+        hub = await new_hub()
+        await hub.on_binary(b"\xff\xd8" + b"\0" * 100)
+
+        frame = fanout.LatestFrame()
+        await hub.subscribe(frame)
+        await hub.on_binary(b"\xff\xd8" + b"\1" * 100)
+        assert await frame.get() == b"\xff\xd8" + b"\1" * 100
+
+        hub.task.cancel()
+
+    asyncio.run(main())
+
+
+def test_prewarm_shares_hub(monkeypatch):
+    monkeypatch.setattr(fanout.Hub, "run", lambda self: asyncio.sleep(3600))
+
+    async def main():
+        hass = types.SimpleNamespace(loop=asyncio.get_running_loop())
+        url = "ws://localhost:1984/api/ws?src=cam"
+        warm = prewarm.Warm(hass, "http://localhost:1984/", url, None)
+        await asyncio.sleep(0)
+
+        hub = fanout.HUBS.pop((url, prewarm.MSE_REQUEST))
+        assert hub.subscribers == {warm}
+        await hub.on_binary(mp4_init())
+        assert warm.connected
+
+        warm.task.cancel()
+        await asyncio.sleep(0)
+        assert not hub.subscribers
+        hub.task.cancel()
+
+    asyncio.run(main())
+
+
+def test_prewarm_and_buffer_share_hub(monkeypatch):
+    monkeypatch.setattr(fanout.Hub, "run", lambda self: asyncio.sleep(3600))
+
+    async def main():
+        hass = types.SimpleNamespace(loop=asyncio.get_running_loop())
+        url = "ws://localhost:1984/api/ws?src=cam"
+        warm = prewarm.Warm(hass, "http://localhost:1984/", url, None)
+        buf = buffer.StreamBuffer(hass, url, 100_000, 30)
+        await asyncio.sleep(0)
+
+        # one upstream for both hidden consumers
+        hub = fanout.HUBS.pop((url, prewarm.MSE_REQUEST))
+        assert hub.subscribers == {warm, buf}
+
+        init = mp4_init()
+        await hub.on_binary(init)
+        await hub.on_binary(mp4_fragment(1, True))
+        assert buf.init == init
+        assert len(buf.ring.items) == 1
+
+        warm.task.cancel()
+        buf.task.cancel()
+        hub.task.cancel()
+
+    asyncio.run(main())
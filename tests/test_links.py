@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+from custom_components.webrtc.links import LinkStore
+
+
+def test_expire(monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+
+    async def main():
+        nonlocal now
+        links = LinkStore()
+        links.add("a", "rtsp://a", None, 0, 10)
+        links.add("b", "rtsp://b", None, 0, 5)
+        links.add("c", "rtsp://c", None, 0, 0)
+        assert links.expires[0][1] == "b"
+
+        now += 6
+        links.expire()
+        assert "b" not in links and "a" in links and "c" in links
+
+        # replaced link keeps new expiration, old heap item is skipped
+        links.add("a", "rtsp://a", None, 0, 10)
+        now += 5
+        links.expire()
+        assert "a" in links
+
+        now += 10
+        links.expire()
+        assert list(links.links) == ["c"]
+        assert links.timer is None
+
+    asyncio.run(main())
+
+
+def test_one_time_link(monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+
+    async def main():
+        nonlocal now
+        links = LinkStore()
+        links.add("once", "rtsp://a", None, 1, 60)
+        links.add("many", "rtsp://a", None, 0, 60)
+
+        assert links.use("once")["url"] == "rtsp://a"
+        assert "once" not in links
+
+        for _ in range(3):
+            assert links.use("many")
+        assert "many" in links
+
+        # expired link, that isn't removed by timer yet
+        now += 61
+        assert links.use("many") is None
+        assert len(links) == 0
+
+    asyncio.run(main())
+
+
+def test_maxsize():
+    async def main():
+        links = LinkStore(maxsize=2)
+        links.add("a", "rtsp://a", None, 0, 60)
+        links.add("b", "rtsp://b", None, 0, 30)
+        # nearest expiring link is removed
+        links.add("c", "rtsp://c", None, 0, 60)
+        assert list(links.links) == ["a", "c"]
+
+        links = LinkStore(maxsize=2)
+        links.add("a", "rtsp://a", None, 0, 0)
+        links.add("b", "rtsp://b", None, 0, 0)
+        # oldest link is removed if links don't expire
+        links.add("c", "rtsp://c", None, 0, 0)
+        assert list(links.links) == ["b", "c"]
+
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+import asyncio
+import struct
+
+import aiohttp
+
+from custom_components.webrtc import mp4
+from custom_components.webrtc.utils import WebSocketForward
+
+JPEG = b"\xff\xd8" + b"\0" * 100
+
+
+def box(name: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + name + payload
+
+
+def full_box(name: bytes, version: int, flags: int, payload: bytes) -> bytes:
+    return box(name, bytes([version]) + flags.to_bytes(3, "big") + payload)
+
+
+def mp4_init(tracks=((1, b"vide", 0), (2, b"soun", 0))) -> bytes:
+    traks = b""
+    for track_id, handler, version in tracks:
+        # version 1 has 64-bit creation and modification time
+        times = b"\0" * (16 if version else 8)
+        tkhd = full_box(b"tkhd", version, 3, times + struct.pack(">I", track_id))
+        hdlr = full_box(b"hdlr", 0, 0, b"\0" * 4 + handler + b"\0" * 12)
+        traks += box(b"trak", tkhd + box(b"mdia", hdlr))
+    return box(b"ftyp", b"iso5\0\0\0\0") + box(b"moov", traks)
+
+
+def mp4_fragment(track_id: int, keyframe: bool, size: int = 100, first=True) -> bytes:
+    flags = 0x02000000 if keyframe else 0x01010000
+    if first:
+        # sync flags of the first sample in trun, default flags in tfhd
+        tfhd = full_box(b"tfhd", 0, 0x20, struct.pack(">II", track_id, 0x01010000))
+        trun = full_box(b"trun", 0, 0x205, struct.pack(">IiII", 1, 0, flags, size))
+    else:
+        tfhd = full_box(b"tfhd", 0, 0x20, struct.pack(">II", track_id, flags))
+        trun = full_box(b"trun", 0, 0x201, struct.pack(">IiI", 1, 0, size))
+    moof = box(b"moof", box(b"traf", tfhd + trun))
+    return moof + box(b"mdat", b"\0" * size)
+
+
+def test_boxes():
+    init = mp4_init()
+    assert mp4.is_init(init) and not mp4.is_fragment(init)
+
+    frag = mp4_fragment(1, True)
+    assert mp4.is_fragment(frag) and not mp4.is_init(frag)
+
+    assert not mp4.is_init(JPEG) and not mp4.is_fragment(JPEG)
+
+
+def test_video_tracks():
+    assert mp4.video_tracks(mp4_init()) == {1}
+    assert mp4.video_tracks(mp4_init(((3, b"vide", 1), (1, b"soun", 0)))) == {3}
+    assert mp4.video_tracks(mp4_init(((1, b"soun", 0),))) == set()
+
+
+def test_is_keyframe():
+    assert mp4.is_keyframe(mp4_fragment(1, True), {1})
+    assert not mp4.is_keyframe(mp4_fragment(1, False), {1})
+
+    # flags from tfhd default sample flags
+    assert mp4.is_keyframe(mp4_fragment(1, True, first=False), {1})
+    assert not mp4.is_keyframe(mp4_fragment(1, False, first=False), {1})
+
+    # audio fragment isn't keyframe for stream with video
+    assert not mp4.is_keyframe(mp4_fragment(2, True), {1})
+    assert mp4.is_keyframe(mp4_fragment(2, True))
+
+    assert not mp4.is_keyframe(JPEG)
+
+
+def queued(forward: WebSocketForward) -> list:
+    """Take items from the queue, like the writer does."""
+    items = []
+    while not forward.queue.empty():
+        item = forward.queue.get_nowait()
+        if item[0] is aiohttp.WSMsgType.BINARY:
+            forward.queued_bytes -= len(item[1])
+        items.append(item)
+    return items
+
+
+def test_drop_policy():
+    async def main():
+        forward = WebSocketForward(None, None, 1200, "drop")
+        init = mp4_init()
+        key, delta = mp4_fragment(1, True, 400), mp4_fragment(1, False, 400)
+
+        for data in (init, key, delta, delta):
+            assert await forward.put_binary(data)
+        assert [data for _, data in queued(forward)] == [init, key, delta]
+
+        # after overflow frames are dropped until the next keyframe
+        assert forward.wait_keyframe
+        for data in (delta, key, delta):
+            assert await forward.put_binary(data)
+        assert forward.dropped_messages == 2
+
+        # init segment is always delivered
+        for _ in range(3):
+            assert await forward.put_binary(init)
+
+        assert [data for _, data in queued(forward)] == [key, delta, init, init, init]
+
+    asyncio.run(main())
+
+
+def test_disconnect_policy():
+    async def main():
+        forward = WebSocketForward(None, None, 1000, "disconnect")
+        assert await forward.put_binary(mp4_fragment(1, True, 800))
+        assert not await forward.put_binary(mp4_fragment(1, False, 800))
+
+        # queue is dropped and the writer will close the socket
+        assert forward.queued_bytes == 0
+        assert queued(forward) == [(aiohttp.WSMsgType.CLOSE, None)]
+        assert not await forward.put_binary(mp4_fragment(1, True, 10))
+
+    asyncio.run(main())
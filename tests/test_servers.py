@@ -0,0 +1,81 @@
+import types
+
+from custom_components.webrtc import utils
+from custom_components.webrtc.utils import Servers
+
+MAIN = "http://localhost:1984/"
+NODE1 = "http://192.168.1.124:1984/"
+NODE2 = "http://192.168.1.125:1984/"
+
+
+def servers(routing: str) -> Servers:
+    reg = Servers()
+    reg.servers = {
+        MAIN: {"available": True, "sessions": 0},
+        NODE1: {"available": True, "sessions": 0},
+        NODE2: {"available": True, "sessions": 0},
+    }
+    reg.routing = routing
+    return reg
+
+
+def test_least_loaded():
+    reg = servers("least_loaded")
+    assert reg.get() == MAIN
+
+    for _ in range(6):
+        reg.acquire(reg.get("rtsp://camera1"))
+    assert [s["sessions"] for s in reg.servers.values()] == [2, 2, 2]
+
+    reg.release(NODE1)
+    assert reg.get("rtsp://camera1") == NODE1
+
+    reg.set_available(NODE1, False)
+    assert reg.get("rtsp://camera1") != NODE1
+
+
+def test_hash():
+    reg = servers("hash")
+    srcs = [f"rtsp://camera{i}" for i in range(20)]
+    routes = {src: reg.get(src) for src in srcs}
+    assert len(set(routes.values())) > 1
+
+    # only streams of unavailable server are moved
+    reg.set_available(NODE2, False)
+    for src in srcs:
+        if routes[src] != NODE2:
+            assert reg.get(src) == routes[src]
+        else:
+            assert reg.get(src) != NODE2
+
+
+def test_unavailable():
+    reg = servers("least_loaded")
+    for url in (MAIN, NODE1, NODE2):
+        reg.set_available(url, False)
+
+    # main server is kept, so one failed check doesn't break everything
+    assert reg.urls() == [MAIN]
+    assert reg.get("rtsp://camera1") == MAIN
+
+
+def test_embedded_unavailable():
+    reg = Servers()
+    reg.server = types.SimpleNamespace(available=False)
+    reg.servers = {
+        utils.DEFAULT_URL: {"available": True, "sessions": 0},
+        NODE1: {"available": True, "sessions": 0},
+    }
+    reg.set_available(NODE1, False)
+    assert reg.get() == utils.DEFAULT_URL
+
+
+def test_single_server():
+    hass = types.SimpleNamespace(loop=None)
+    reg = Servers()
+    reg.setup(hass, NODE1, [], "least_loaded")
+    assert reg.task is None
+
+    # connection error while go2rtc restarts
+    reg.set_available(NODE1, False)
+    assert reg.get() == NODE1
@@ -0,0 +1,49 @@
+import asyncio
+import types
+
+import pytest
+
+from custom_components.webrtc import stats
+from custom_components.webrtc.stats import Session, Stats
+
+
+def test_closed_groups_limit(monkeypatch):
+    monkeypatch.setattr(stats, "GROUPS_MAXSIZE", 2)
+    total = Stats()
+
+    for remote in ("1.1.1.1", "1.1.1.2", "1.1.1.1", "1.1.1.3"):
+        session = Session()
+        session.src = "cam1"
+        session.remote = remote
+        total.start(session)
+        total.stop(session)
+
+    assert total.grouped("src") == {
+        "cam1": {
+            "sessions": 4,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "messages_in": 0,
+            "messages_out": 0,
+        }
+    }
+    # least recently closed client is removed
+    assert list(total.grouped("remote")) == ["1.1.1.1", "1.1.1.3"]
+    assert total.totals()["sessions"] == 4
+
+
+def test_stats_view_admin():
+    from aiohttp.web_exceptions import HTTPUnauthorized
+
+    from custom_components.webrtc import StatsView
+
+    async def main():
+        user = types.SimpleNamespace(is_admin=False)
+        with pytest.raises(HTTPUnauthorized):
+            await StatsView().get({"hass_user": user})
+
+        user.is_admin = True
+        response = await StatsView().get({"hass_user": user})
+        assert response.status == 200
+
+    asyncio.run(main())